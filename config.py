@@ -11,4 +11,23 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # Add this line to enable pre-ping, which checks database connections before use
     SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    # Dashboard API response cache: per-worker LRU size, plus an optional Redis URL shared by all workers
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 512))
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 86400))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    # Monthly statement PDFs are rendered by a background thread pool in each worker and
+    # cached on disk, least recently used first out once the cache exceeds its size limit
+    STATEMENT_WORKERS = int(os.environ.get('STATEMENT_WORKERS', 2))
+    STATEMENT_DIR = os.environ.get('STATEMENT_DIR') or os.path.join(basedir, 'instance', 'statements')
+    STATEMENT_CACHE_MAX_BYTES = int(os.environ.get('STATEMENT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    # Queued/running jobs older than this (seconds) were left behind by a restarted worker and are failed
+    STATEMENT_JOB_TIMEOUT = int(os.environ.get('STATEMENT_JOB_TIMEOUT', 1800))
+    # 'pdfkit' (wkhtmltopdf subprocess) or 'reportlab' (in-process, needs `pip install reportlab`)
+    STATEMENT_RENDERER = os.environ.get('STATEMENT_RENDERER', 'pdfkit')
+    # Per-worker cache of the logged-in user's role, units and fee. Only the worker that changes a user
+    # drops its entry, so revoked units, role changes and deleted users still work on the other workers
+    # for up to PRINCIPAL_CACHE_TTL seconds (the revocation window). 0 disables the cache.
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 256))
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
     DEBUG = False
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""Add per-month data versions for the statement PDF cache
+
+Revision ID: 1f8d6a3c5e90
+Revises: 7c4e2b9d1a63
+Create Date: 2026-10-18 17:02:14.730265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f8d6a3c5e90'
+down_revision = '7c4e2b9d1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('period_version',
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('year', 'month')
+    )
+    op.execute(
+        'INSERT INTO period_version (year, month, version) '
+        'SELECT DISTINCT year, month, COALESCE((SELECT version FROM data_version WHERE id = 1), 0) FROM monthly_unit_rollup'
+    )
+
+
+def downgrade():
+    op.drop_table('period_version')
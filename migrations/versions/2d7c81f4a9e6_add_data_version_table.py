@@ -0,0 +1,29 @@
+"""Add data version table for response cache invalidation
+
+Revision ID: 2d7c81f4a9e6
+Revises: 9b3e57d0c412
+Create Date: 2026-10-18 11:26:40.918311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7c81f4a9e6'
+down_revision = '9b3e57d0c412'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_version = op.create_table('data_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(data_version, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,62 @@
+"""Add channel dimension and unit/channel keys on booking and expense
+
+Revision ID: 3a7c9e5d2f48
+Revises: 8d3f6b2a9c17
+Create Date: 2026-10-18 20:03:55.917204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c9e5d2f48'
+down_revision = '8d3f6b2a9c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('channel',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('channel_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_booking_unit_id'), ['unit_id'], unique=False)
+        batch_op.create_foreign_key('fk_booking_unit_id_unit', 'unit', ['unit_id'], ['id'])
+        batch_op.create_foreign_key('fk_booking_channel_id_channel', 'channel', ['channel_id'], ['id'])
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_expense_unit_id'), ['unit_id'], unique=False)
+        batch_op.create_foreign_key('fk_expense_unit_id_unit', 'unit', ['unit_id'], ['id'])
+
+    # Register every name in use, then point the fact rows at their dimension rows.
+    op.execute(
+        "INSERT INTO unit (name) SELECT DISTINCT unit_name FROM ("
+        "SELECT unit_name FROM booking UNION SELECT unit_name FROM expense) names "
+        "WHERE unit_name IS NOT NULL AND unit_name <> '' AND unit_name NOT IN (SELECT name FROM unit)"
+    )
+    op.execute(
+        "INSERT INTO channel (name) SELECT DISTINCT channel FROM booking "
+        "WHERE channel IS NOT NULL AND channel <> ''"
+    )
+    op.execute('UPDATE booking SET unit_id = (SELECT id FROM unit WHERE unit.name = booking.unit_name), '
+               'channel_id = (SELECT id FROM channel WHERE channel.name = booking.channel)')
+    op.execute('UPDATE expense SET unit_id = (SELECT id FROM unit WHERE unit.name = expense.unit_name)')
+
+
+def downgrade():
+    # Dropping a key column drops its foreign key with it.
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_expense_unit_id'))
+        batch_op.drop_column('unit_id')
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_booking_unit_id'))
+        batch_op.drop_column('channel_id')
+        batch_op.drop_column('unit_id')
+
+    op.drop_table('channel')
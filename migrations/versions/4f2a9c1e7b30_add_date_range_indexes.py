@@ -0,0 +1,36 @@
+"""Add date range indexes to booking and expense
+
+Revision ID: 4f2a9c1e7b30
+Revises: c17b74874718
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c1e7b30'
+down_revision = 'c17b74874718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_unit_name_checkin', ['unit_name', 'checkin'], unique=False)
+        batch_op.create_index(batch_op.f('ix_booking_checkin'), ['checkin'], unique=False)
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.create_index('ix_expense_unit_name_date', ['unit_name', 'date'], unique=False)
+        batch_op.create_index(batch_op.f('ix_expense_date'), ['date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_expense_date'))
+        batch_op.drop_index('ix_expense_unit_name_date')
+
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_booking_checkin'))
+        batch_op.drop_index('ix_booking_unit_name_checkin')
@@ -0,0 +1,84 @@
+"""Replace rollup nights with occupied nights and night revenue split by month
+
+Revision ID: 5b2e8f1a7d34
+Revises: 1f8d6a3c5e90
+Create Date: 2026-10-18 18:41:09.512837
+
+The new columns are computed here from the bookings, so the rollups are correct as soon as
+`flask db upgrade` finishes; the split is kept self-contained rather than importing rollups.py.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import math
+from datetime import date
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8f1a7d34'
+down_revision = '1f8d6a3c5e90'
+branch_labels = None
+depends_on = None
+
+
+booking_table = sa.table('booking', sa.column('unit_name', sa.String), sa.column('checkin', sa.Date),
+                         sa.column('checkout', sa.Date), sa.column('total', sa.Float))
+rollup_table = sa.table('monthly_unit_rollup', sa.column('unit_name', sa.String), sa.column('year', sa.Integer),
+                        sa.column('month', sa.Integer), sa.column('revenue', sa.Float), sa.column('cleaning_fees', sa.Float),
+                        sa.column('platform_charges', sa.Float), sa.column('booking_count', sa.Integer),
+                        sa.column('expenses', sa.Float), sa.column('occupied_nights', sa.Integer),
+                        sa.column('night_revenue', sa.Float))
+
+
+def _split_stays(bind):
+    """{(unit, year, month): [nights, revenue]} with each stay's nights and revenue spread over the months they fall in."""
+    buckets = {}
+    stays = bind.execute(sa.select(booking_table).where(booking_table.c.checkin.isnot(None),
+                                                         booking_table.c.checkout > booking_table.c.checkin))
+    for unit_name, checkin, checkout, total in stays:
+        total = 0.0 if total is None or math.isnan(total) else total
+        nights = (checkout - checkin).days
+        start = checkin
+        while start < checkout:
+            next_month = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+            end = min(checkout, next_month)
+            bucket = buckets.setdefault((unit_name, start.year, start.month), [0, 0.0])
+            bucket[0] += (end - start).days
+            bucket[1] += total * (end - start).days / nights
+            start = end
+    return buckets
+
+
+def upgrade():
+    with op.batch_alter_table('monthly_unit_rollup', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('occupied_nights', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('night_revenue', sa.Float(), nullable=False, server_default='0'))
+        batch_op.drop_column('nights')
+
+    # Migration 9b3e57d0c412 seeded booking and expense totals as separate rows for the same
+    # (unit_name, year, month); merge them into one row per key so the split nights land once.
+    bind = op.get_bind()
+    metrics = ('revenue', 'cleaning_fees', 'platform_charges', 'booking_count', 'expenses')
+    key = (rollup_table.c.unit_name, rollup_table.c.year, rollup_table.c.month)
+    rows = {}
+    for row in bind.execute(sa.select(*key, *(sa.func.sum(rollup_table.c[m]) for m in metrics)).group_by(*key)):
+        rows[tuple(row[:3])] = dict(zip(metrics, row[3:]), occupied_nights=0, night_revenue=0.0)
+    for bucket, (nights, revenue) in _split_stays(bind).items():
+        # Months a stay runs into without a checkin or expense of that unit had no rollup row yet.
+        row = rows.setdefault(bucket, dict(dict.fromkeys(metrics, 0), occupied_nights=0, night_revenue=0.0))
+        row['occupied_nights'], row['night_revenue'] = nights, revenue
+    op.execute(rollup_table.delete())
+    if rows:
+        op.bulk_insert(rollup_table, [dict(unit_name=u, year=y, month=m, **row) for (u, y, m), row in rows.items()])
+    # Occupancy changed for every month with stays, so cached responses and statements must not be reused.
+    op.execute('UPDATE data_version SET version = version + 1')
+    op.execute('UPDATE period_version SET version = (SELECT version FROM data_version WHERE id = 1)')
+
+
+def downgrade():
+    with op.batch_alter_table('monthly_unit_rollup', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('nights', sa.Integer(), nullable=False, server_default='0'))
+    op.execute('UPDATE monthly_unit_rollup SET nights = occupied_nights')
+    with op.batch_alter_table('monthly_unit_rollup', schema=None) as batch_op:
+        batch_op.drop_column('night_revenue')
+        batch_op.drop_column('occupied_nights')
@@ -0,0 +1,51 @@
+"""Add import source keys and imported file fingerprints
+
+Revision ID: 6a0f3d92e5b8
+Revises: 2d7c81f4a9e6
+Create Date: 2026-10-18 13:41:08.327716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a0f3d92e5b8'
+down_revision = '2d7c81f4a9e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('imported_file',
+    sa.Column('file_name', sa.String(length=255), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('mtime', sa.Float(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('imported_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('file_name')
+    )
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('source_file', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_booking_source_key'), ['source_key'], unique=True)
+
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('source_file', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_expense_source_key'), ['source_key'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_expense_source_key'))
+        batch_op.drop_column('source_file')
+        batch_op.drop_column('source_key')
+
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_booking_source_key'))
+        batch_op.drop_column('source_file')
+        batch_op.drop_column('source_key')
+
+    op.drop_table('imported_file')
@@ -0,0 +1,45 @@
+"""Add statement job table for background PDF generation
+
+Revision ID: 7c4e2b9d1a63
+Revises: e3b9a4c71f25
+Create Date: 2026-10-18 16:20:37.551092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e2b9d1a63'
+down_revision = 'e3b9a4c71f25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('statement_job',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.String(length=80), nullable=False),
+    sa.Column('batch_id', sa.String(length=36), nullable=True),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('room_type', sa.String(length=120), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('statement_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_statement_job_batch_id'), ['batch_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_statement_job_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('statement_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_statement_job_user_id'))
+        batch_op.drop_index(batch_op.f('ix_statement_job_batch_id'))
+
+    op.drop_table('statement_job')
@@ -0,0 +1,74 @@
+"""Replace user.allowed_units JSON with unit and user_unit tables
+
+Revision ID: 8d3f6b2a9c17
+Revises: 5b2e8f1a7d34
+Create Date: 2026-10-18 19:26:48.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6b2a9c17'
+down_revision = '5b2e8f1a7d34'
+branch_labels = None
+depends_on = None
+
+user_table = sa.table('user', sa.column('id', sa.String), sa.column('allowed_units', sa.JSON))
+unit_table = sa.table('unit', sa.column('id', sa.Integer), sa.column('name', sa.String))
+user_unit_table = sa.table('user_unit', sa.column('user_id', sa.String), sa.column('unit_id', sa.Integer))
+
+
+def upgrade():
+    op.create_table('unit',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('user_unit',
+    sa.Column('user_id', sa.String(length=80), nullable=False),
+    sa.Column('unit_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['unit_id'], ['unit.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'unit_id')
+    )
+    with op.batch_alter_table('user_unit', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_unit_unit_id'), ['unit_id'], unique=False)
+
+    # Every unit an owner was granted or that has bookings/expenses, then the grants themselves.
+    bind = op.get_bind()
+    grants = {user_id: [name for name in (units or []) if name] for user_id, units in bind.execute(sa.select(user_table.c.id, user_table.c.allowed_units))}
+    names = {name for units in grants.values() for name in units}
+    for table in ('booking', 'expense'):
+        names.update(r[0] for r in bind.execute(sa.text(f'SELECT DISTINCT unit_name FROM {table}')) if r[0])
+    if names:
+        op.bulk_insert(unit_table, [{'name': name} for name in sorted(names)])
+    unit_ids = dict(bind.execute(sa.select(unit_table.c.name, unit_table.c.id)).all())
+    rows = [{'user_id': user_id, 'unit_id': unit_ids[name]} for user_id, units in grants.items() for name in set(units)]
+    if rows:
+        op.bulk_insert(user_unit_table, rows)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('allowed_units')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('allowed_units', sa.JSON(), nullable=True))
+
+    bind = op.get_bind()
+    grants = {}
+    query = (sa.select(user_unit_table.c.user_id, unit_table.c.name)
+             .join(unit_table, unit_table.c.id == user_unit_table.c.unit_id).order_by(unit_table.c.name))
+    for user_id, name in bind.execute(query):
+        grants.setdefault(user_id, []).append(name)
+    for user_id, in bind.execute(sa.select(user_table.c.id)).all():
+        bind.execute(user_table.update().where(user_table.c.id == user_id).values(allowed_units=grants.get(user_id, [])))
+
+    with op.batch_alter_table('user_unit', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_unit_unit_id'))
+
+    op.drop_table('user_unit')
+    op.drop_table('unit')
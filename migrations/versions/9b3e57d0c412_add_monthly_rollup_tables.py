@@ -0,0 +1,97 @@
+"""Add monthly unit and channel rollup tables
+
+Revision ID: 9b3e57d0c412
+Revises: 4f2a9c1e7b30
+Create Date: 2026-10-18 10:03:17.552093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3e57d0c412'
+down_revision = '4f2a9c1e7b30'
+branch_labels = None
+depends_on = None
+
+
+def _nan_safe_sum(column):
+    return sa.func.coalesce(sa.func.sum(sa.func.nullif(column, sa.literal(float('nan')))), 0.0)
+
+
+def upgrade():
+    monthly_unit_rollup = op.create_table('monthly_unit_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('unit_name', sa.String(length=120), nullable=True),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('cleaning_fees', sa.Float(), nullable=False),
+    sa.Column('platform_charges', sa.Float(), nullable=False),
+    sa.Column('nights', sa.Integer(), nullable=False),
+    sa.Column('booking_count', sa.Integer(), nullable=False),
+    sa.Column('expenses', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('monthly_unit_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_monthly_unit_rollup_key', ['unit_name', 'year', 'month'], unique=False)
+        batch_op.create_index(batch_op.f('ix_monthly_unit_rollup_year'), ['year'], unique=False)
+
+    monthly_channel_rollup = op.create_table('monthly_channel_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('unit_name', sa.String(length=120), nullable=True),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.String(length=80), nullable=True),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('booking_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('monthly_channel_rollup', schema=None) as batch_op:
+        batch_op.create_index('ix_monthly_channel_rollup_key', ['unit_name', 'year', 'month'], unique=False)
+        batch_op.create_index(batch_op.f('ix_monthly_channel_rollup_year'), ['year'], unique=False)
+
+    # Seed the rollups from the existing data. Booking and expense totals land in separate
+    # rows for the same (unit_name, year, month); readers always SUM, and the next
+    # 'flask rebuild-rollups' or write to that month merges them.
+    booking = sa.table('booking', sa.column('id'), sa.column('unit_name'), sa.column('checkin'), sa.column('channel'),
+                       sa.column('duration'), sa.column('cleaning_fee'), sa.column('platform_charge'), sa.column('total'))
+    expense = sa.table('expense', sa.column('unit_name'), sa.column('date'), sa.column('debit'))
+
+    b_year, b_month = sa.extract('year', booking.c.checkin), sa.extract('month', booking.c.checkin)
+    op.execute(monthly_unit_rollup.insert().from_select(
+        ['unit_name', 'year', 'month', 'revenue', 'cleaning_fees', 'platform_charges', 'nights', 'booking_count', 'expenses'],
+        sa.select(booking.c.unit_name, b_year, b_month, _nan_safe_sum(booking.c.total), _nan_safe_sum(booking.c.cleaning_fee),
+                  _nan_safe_sum(booking.c.platform_charge), sa.func.coalesce(sa.func.sum(booking.c.duration), 0),
+                  sa.func.count(booking.c.id), sa.literal(0.0))
+        .where(booking.c.checkin.isnot(None))
+        .group_by(booking.c.unit_name, b_year, b_month)
+    ))
+    op.execute(monthly_channel_rollup.insert().from_select(
+        ['unit_name', 'year', 'month', 'channel', 'revenue', 'booking_count'],
+        sa.select(booking.c.unit_name, b_year, b_month, booking.c.channel, _nan_safe_sum(booking.c.total), sa.func.count(booking.c.id))
+        .where(booking.c.checkin.isnot(None))
+        .group_by(booking.c.unit_name, b_year, b_month, booking.c.channel)
+    ))
+    e_year, e_month = sa.extract('year', expense.c.date), sa.extract('month', expense.c.date)
+    op.execute(monthly_unit_rollup.insert().from_select(
+        ['unit_name', 'year', 'month', 'revenue', 'cleaning_fees', 'platform_charges', 'nights', 'booking_count', 'expenses'],
+        sa.select(expense.c.unit_name, e_year, e_month, sa.literal(0.0), sa.literal(0.0), sa.literal(0.0),
+                  sa.literal(0), sa.literal(0), _nan_safe_sum(expense.c.debit))
+        .where(expense.c.date.isnot(None))
+        .group_by(expense.c.unit_name, e_year, e_month)
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('monthly_channel_rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_monthly_channel_rollup_year'))
+        batch_op.drop_index('ix_monthly_channel_rollup_key')
+
+    op.drop_table('monthly_channel_rollup')
+    with op.batch_alter_table('monthly_unit_rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_monthly_unit_rollup_year'))
+        batch_op.drop_index('ix_monthly_unit_rollup_key')
+
+    op.drop_table('monthly_unit_rollup')
@@ -0,0 +1,39 @@
+"""Key the booking and expense unit/date indexes on unit_id instead of unit_name
+
+Revision ID: a5e2d8c4b716
+Revises: c4818a67357c
+Create Date: 2026-10-18 22:05:31.604217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5e2d8c4b716'
+down_revision = 'c4818a67357c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The composites cover the single-column unit_id indexes through their prefix.
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_unit_id_checkin_checkout', ['unit_id', 'checkin', 'checkout'], unique=False)
+        batch_op.drop_index('ix_booking_unit_name_checkin_checkout')
+        batch_op.drop_index(batch_op.f('ix_booking_unit_id'))
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.create_index('ix_expense_unit_id_date', ['unit_id', 'date'], unique=False)
+        batch_op.drop_index('ix_expense_unit_name_date')
+        batch_op.drop_index(batch_op.f('ix_expense_unit_id'))
+
+
+def downgrade():
+    with op.batch_alter_table('expense', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_expense_unit_id'), ['unit_id'], unique=False)
+        batch_op.create_index('ix_expense_unit_name_date', ['unit_name', 'date'], unique=False)
+        batch_op.drop_index('ix_expense_unit_id_date')
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_booking_unit_id'), ['unit_id'], unique=False)
+        batch_op.create_index('ix_booking_unit_name_checkin_checkout', ['unit_name', 'checkin', 'checkout'], unique=False)
+        batch_op.drop_index('ix_booking_unit_id_checkin_checkout')
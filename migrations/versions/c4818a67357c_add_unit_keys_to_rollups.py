@@ -0,0 +1,31 @@
+"""Add unit keys to the monthly rollups
+
+Revision ID: c4818a67357c
+Revises: 3a7c9e5d2f48
+Create Date: 2026-10-18 21:12:40.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4818a67357c'
+down_revision = '3a7c9e5d2f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('monthly_unit_rollup', 'monthly_channel_rollup'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('unit_id', sa.Integer(), nullable=True))
+            batch_op.create_index(batch_op.f(f'ix_{table}_unit_id'), ['unit_id'], unique=False)
+        op.execute(f'UPDATE {table} SET unit_id = (SELECT id FROM unit WHERE unit.name = {table}.unit_name)')
+
+
+def downgrade():
+    for table in ('monthly_channel_rollup', 'monthly_unit_rollup'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_unit_id'))
+            batch_op.drop_column('unit_id')
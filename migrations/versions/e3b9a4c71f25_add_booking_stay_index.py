@@ -0,0 +1,28 @@
+"""Widen the booking unit/checkin index to cover checkout
+
+Revision ID: e3b9a4c71f25
+Revises: 6a0f3d92e5b8
+Create Date: 2026-10-18 15:06:52.913604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b9a4c71f25'
+down_revision = '6a0f3d92e5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_unit_name_checkin_checkout', ['unit_name', 'checkin', 'checkout'], unique=False)
+        batch_op.drop_index('ix_booking_unit_name_checkin')
+
+
+def downgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_unit_name_checkin', ['unit_name', 'checkin'], unique=False)
+        batch_op.drop_index('ix_booking_unit_name_checkin_checkout')
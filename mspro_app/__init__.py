@@ -1,7 +1,9 @@
 from flask import Flask
 from .extensions import db, login_manager, migrate
+from .cache import response_cache
+from .statements import statement_queue, statement_cache
+from .principals import principal_cache
 from .routes import main as main_blueprint
-from .models import User
 import math
 
 def create_app():
@@ -12,14 +14,18 @@ def create_app():
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
+    response_cache.init_app(app)
+    statement_queue.init_app(app)
+    statement_cache.init_app(app)
+    principal_cache.init_app(app)
 
     # Register blueprint
     app.register_blueprint(main_blueprint)
 
-    # Define user loader
+    # Define user loader; serves cached principals rather than querying the user table per request
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(user_id)
+        return principal_cache.load(user_id)
 
     # Register custom template filter
     @app.template_filter('clean_nan')
@@ -0,0 +1,222 @@
+from flask_login import current_user
+from sqlalchemy import case, func, literal
+import calendar
+from .extensions import db
+from .models import MonthlyUnitRollup, MonthlyChannelRollup
+from .filters import unit_scope
+
+def nan_safe_sum(column):
+    """SUM that treats NULL and float NaN as zero, matching clean_nan on the Python side."""
+    return func.coalesce(func.sum(func.nullif(column, literal(float('nan')))), 0.0)
+
+def _scoped_sum(column, scope):
+    return func.coalesce(func.sum(case((scope, column), else_=0)), 0)
+
+def _rollup_scopes(room_type):
+    # Booking and expense metrics share a rollup row but follow different unit rules:
+    # general (unit-less) expenses are visible to every owner, unit-less bookings are not.
+    return (unit_scope(MonthlyUnitRollup, room_type),
+            unit_scope(MonthlyUnitRollup, room_type, include_general=True))
+
+def monthly_totals(years, room_type=None):
+    """
+    Returns month-bucketed revenue, expenses and cleaning fees for every requested year
+    from the monthly rollups: {year: {'revenue': [12], 'expenses': [12], 'cleaning_fees': [12]}}.
+    """
+    years = sorted({int(y) for y in years if y})
+    totals = {y: {'revenue': [0.0] * 12, 'expenses': [0.0] * 12, 'cleaning_fees': [0.0] * 12} for y in years}
+    if not years:
+        return totals
+
+    booking_scope, expense_scope = _rollup_scopes(room_type)
+    query = db.session.query(
+        MonthlyUnitRollup.year, MonthlyUnitRollup.month,
+        _scoped_sum(MonthlyUnitRollup.revenue, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.cleaning_fees, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.expenses, expense_scope)
+    ).filter(MonthlyUnitRollup.year.in_(years), booking_scope | expense_scope)
+
+    for year, month, revenue, cleaning_fees, expenses in query.group_by(MonthlyUnitRollup.year, MonthlyUnitRollup.month):
+        bucket = totals[year]
+        bucket['revenue'][month - 1] = revenue
+        bucket['cleaning_fees'][month - 1] = cleaning_fees
+        bucket['expenses'][month - 1] = expenses
+
+    return totals
+
+def management_fee_rate():
+    """The current user's management fee percentage, 30% when none is set."""
+    fee_rate = 30.0
+    if current_user.is_authenticated:
+        user_fee = getattr(current_user, 'management_fee_percentage', 30.0)
+        if user_fee is not None:
+            fee_rate = user_fee
+    return fee_rate
+
+def _room_count(room_type):
+    """
+    Rooms in scope: one for a specific room, the owner's units, or (admin 'All' view) a scalar
+    subquery counting every unit that has had a booking, so it can ride along in the caller's query.
+    """
+    if room_type and room_type != 'All':
+        return 1
+    if current_user.is_authenticated and current_user.role == 'owner':
+        return len(current_user.allowed_units or [])
+    return (db.session.query(func.count(func.distinct(MonthlyUnitRollup.unit_name)))
+            .filter(MonthlyUnitRollup.booking_count > 0).scalar_subquery())
+
+def room_count(room_type):
+    """_room_count evaluated to a number, for callers that need the value rather than an expression."""
+    count = _room_count(room_type)
+    return count if isinstance(count, int) else db.session.query(count).scalar()
+
+def days_in_period(year, month=None, quarter=None):
+    """Exact number of nights in a month, a quarter or (leap years included) a year."""
+    if month:
+        months = [month]
+    elif quarter:
+        months = range(quarter * 3 - 2, quarter * 3 + 1)
+    else:
+        months = range(1, 13)
+    return sum(calendar.monthrange(year, m)[1] for m in months)
+
+def occupancy_metrics(occupied_nights, night_revenue, room_count, days):
+    """Occupancy rate (%), ADR and RevPAR from nights actually stayed within the period."""
+    available = (room_count or 1) * days
+    return {
+        'total_occupancy_rate': occupied_nights / available * 100 if available > 0 else 0,
+        'adr': night_revenue / occupied_nights if occupied_nights else 0,
+        'revpar': night_revenue / available if available > 0 else 0
+    }
+
+def _dashboard_summary(revenue, expenses, occupied_nights, night_revenue, room_count, days):
+    gross_profit = revenue - expenses
+    fee_rate = management_fee_rate()
+    management_fee = gross_profit * (fee_rate / 100.0)
+    return {
+        'total_booking_revenue': revenue, 'total_monthly_expenses': expenses,
+        'gross_profit': gross_profit, 'management_fee': management_fee, 'fee_rate': fee_rate,
+        'monthly_income': gross_profit - management_fee,
+        **occupancy_metrics(occupied_nights, night_revenue, room_count, days)
+    }
+
+def calculate_dashboard_data(year, month, room_type):
+    """
+    Computes the dashboard summary for a period. Revenue, expenses, occupied nights and (for the
+    admin 'All' view) the room count come back from a single query over the rollups. Occupancy
+    counts the nights stayed inside the period, so stays crossing a month boundary are split.
+    """
+    booking_scope, expense_scope = _rollup_scopes(room_type)
+    room_count = _room_count(room_type)
+    columns = [
+        _scoped_sum(MonthlyUnitRollup.revenue, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.expenses, expense_scope),
+        _scoped_sum(MonthlyUnitRollup.occupied_nights, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.night_revenue, booking_scope)
+    ]
+    if not isinstance(room_count, int):
+        columns.append(room_count)
+
+    query = db.session.query(*columns).filter(MonthlyUnitRollup.year == year)
+    if month:
+        query = query.filter(MonthlyUnitRollup.month == month)
+    row = query.one()
+    if not isinstance(room_count, int):
+        room_count = row[4]
+    return _dashboard_summary(*row[:4], room_count, days_in_period(year, month)), {}
+
+def dashboard_data(year, month, compare_year, room_type):
+    """
+    Everything the dashboard shows, from two queries: one pass over the monthly rollups grouped by
+    month, shared by the period summary and both chart series (the admin room count rides along),
+    and one over the channel rollups. Returns (summary, series, channels), with series shaped like
+    monthly_totals and channels like revenue_by_channel.
+    """
+    years = sorted({int(y) for y in (year, compare_year) if y})
+    series = {y: {'revenue': [0.0] * 12, 'expenses': [0.0] * 12, 'cleaning_fees': [0.0] * 12} for y in years}
+    totals = [0.0, 0.0, 0, 0.0]
+    booking_scope, expense_scope = _rollup_scopes(room_type)
+    room_count = _room_count(room_type)
+    columns = [
+        _scoped_sum(MonthlyUnitRollup.revenue, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.expenses, expense_scope),
+        _scoped_sum(MonthlyUnitRollup.occupied_nights, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.night_revenue, booking_scope),
+        _scoped_sum(MonthlyUnitRollup.cleaning_fees, booking_scope)
+    ]
+    if not isinstance(room_count, int):
+        columns.append(room_count)
+
+    query = (db.session.query(MonthlyUnitRollup.year, MonthlyUnitRollup.month, *columns)
+             .filter(MonthlyUnitRollup.year.in_(years), booking_scope | expense_scope)
+             .group_by(MonthlyUnitRollup.year, MonthlyUnitRollup.month))
+    for row in query:
+        row_year, row_month, values = row[0], row[1], row[2:]
+        bucket = series[row_year]
+        bucket['revenue'][row_month - 1] = values[0]
+        bucket['expenses'][row_month - 1] = values[1]
+        bucket['cleaning_fees'][row_month - 1] = values[4]
+        if row_year == year and (not month or row_month == month):
+            totals = [total + value for total, value in zip(totals, values[:4])]
+        if not isinstance(room_count, int):
+            room_count = values[5]
+    if not isinstance(room_count, int):
+        room_count = 1  # no rollup rows, so nothing was occupied either
+
+    summary = _dashboard_summary(*totals, room_count, days_in_period(year, month))
+    return summary, series, revenue_by_channel(year, room_type)
+
+def revenue_by_channel(year, room_type=None):
+    """Returns [(channel, revenue)] for a year, highest revenue first."""
+    revenue = func.sum(MonthlyChannelRollup.revenue)
+    return (db.session.query(MonthlyChannelRollup.channel, revenue)
+            .filter(MonthlyChannelRollup.year == year, unit_scope(MonthlyChannelRollup, room_type))
+            .group_by(MonthlyChannelRollup.channel)
+            .order_by(revenue.desc())
+            .all())
+
+def period_summaries(years, room_type=None, by_quarter=False):
+    """
+    Returns profit and occupancy summaries per year, or per (year, quarter) with by_quarter, from
+    one grouped query over the monthly rollups: {(year, quarter or None): {'total_revenue',
+    'total_expenses', 'gross_profit', 'management_fee', 'net_profit', 'total_occupancy_rate',
+    'adr', 'revpar'}}. Every requested bucket is present.
+    """
+    years = sorted({int(y) for y in years if y})
+    quarters = (1, 2, 3, 4) if by_quarter else (None,)
+    totals = {(y, q): [0.0, 0.0, 0, 0.0] for y in years for q in quarters}
+    room_count = _room_count(room_type)
+    if years:
+        booking_scope, expense_scope = _rollup_scopes(room_type)
+        groups = [MonthlyUnitRollup.year]
+        if by_quarter:
+            groups.append((MonthlyUnitRollup.month + 2) // 3)
+        columns = [
+            _scoped_sum(MonthlyUnitRollup.revenue, booking_scope),
+            _scoped_sum(MonthlyUnitRollup.expenses, expense_scope),
+            _scoped_sum(MonthlyUnitRollup.occupied_nights, booking_scope),
+            _scoped_sum(MonthlyUnitRollup.night_revenue, booking_scope)
+        ]
+        if not isinstance(room_count, int):
+            columns.append(room_count)
+        query = db.session.query(*groups, *columns).filter(MonthlyUnitRollup.year.in_(years), booking_scope | expense_scope)
+        for row in query.group_by(*groups):
+            key = (row[0], int(row[1])) if by_quarter else (row[0], None)
+            values = row[len(groups):]
+            totals[key] = list(values[:4])
+            if not isinstance(room_count, int):
+                room_count = values[4]
+    if not isinstance(room_count, int):
+        room_count = 1  # no rollup rows at all, so nothing was occupied either
+
+    fee_rate = management_fee_rate()
+    summaries = {}
+    for (year, quarter), (revenue, expenses, occupied_nights, night_revenue) in totals.items():
+        gross_profit = revenue - expenses
+        management_fee = gross_profit * (fee_rate / 100.0)
+        summaries[(year, quarter)] = {
+            'total_revenue': revenue, 'total_expenses': expenses, 'gross_profit': gross_profit,
+            'management_fee': management_fee, 'net_profit': gross_profit - management_fee,
+            **occupancy_metrics(occupied_nights, night_revenue, room_count, days_in_period(year, quarter=quarter))
+        }
+    return summaries
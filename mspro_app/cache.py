@@ -0,0 +1,188 @@
+from flask import request, current_app, make_response
+from flask_login import current_user
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import json
+import threading
+from .extensions import db
+from .models import DataVersion, PeriodVersion, MonthlyUnitRollup
+from sqlalchemy import insert
+
+def get_data_version():
+    return db.session.query(DataVersion.version).filter_by(id=1).scalar() or 0
+
+def lock_data_version():
+    """
+    Takes the data_version row lock until the transaction ends (a no-op on SQLite, which
+    serialises writers anyway). Rollup writers take it before deleting and re-inserting
+    buckets, so concurrent refreshes of the same month cannot both insert.
+    """
+    db.session.query(DataVersion.id).filter_by(id=1).with_for_update().scalar()
+
+def bump_data_version(*rollup_keys, all_periods=False):
+    """
+    Marks booking/expense data as changed. Runs in the caller's transaction, so the new version
+    becomes visible on commit. The (unit, year, month) rollup keys of a write also move those
+    months' period versions; with all_periods (imports, rebuilds) every month's version moves.
+    """
+    updated = db.session.query(DataVersion).filter_by(id=1).update(
+        {DataVersion.version: DataVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(DataVersion(id=1, version=1))
+    db.session.flush()
+    version = get_data_version()
+
+    if not all_periods:
+        for year, month in {(key[1], key[2]) for key in rollup_keys if key}:
+            db.session.merge(PeriodVersion(year=year, month=month, version=version))
+    else:
+        db.session.query(PeriodVersion).delete(synchronize_session=False)
+        periods = db.session.query(MonthlyUnitRollup.year, MonthlyUnitRollup.month).distinct().all()
+        if periods:
+            db.session.execute(insert(PeriodVersion), [{'year': y, 'month': m, 'version': version} for y, m in periods])
+
+def get_period_version(year, month):
+    """Version of one month's booking/expense data; 0 for a month that has never had any."""
+    return db.session.query(PeriodVersion.version).filter_by(year=year, month=month).scalar() or 0
+
+class LRUCache:
+    """
+    Thread-safe LRU bounded by entry count. With maxbytes the values must be bytes and their
+    total length is bounded too; a single value longer than maxbytes is not stored.
+    """
+    def __init__(self, maxsize=512, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return len(value) if self.maxbytes is not None else 0
+
+    def _pop(self, key):
+        value = self._data.pop(key, None)
+        if value is not None:
+            self.nbytes -= self._size(value)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and len(value) > self.maxbytes:
+                return
+            self._data[key] = value
+            self.nbytes += self._size(value)
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def __len__(self):
+        return len(self._data)
+
+class ResponseCache:
+    """
+    Caches rendered API responses in a per-worker LRU, optionally backed by Redis so every
+    gunicorn worker shares entries. Keys embed the data version, so writes invalidate exactly.
+    """
+    def __init__(self):
+        self.local = LRUCache(maxbytes=64 * 1024 * 1024)
+        self.shared = None
+        self.ttl = 86400
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def init_app(self, app):
+        self.local = LRUCache(app.config.get('RESPONSE_CACHE_SIZE', 512), app.config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 86400)
+        redis_url = app.config.get('CACHE_REDIS_URL')
+        if redis_url:
+            import redis
+            self.shared = redis.Redis.from_url(redis_url)
+
+    def get(self, key):
+        body = self.local.get(key)
+        if body is None and self.shared is not None:
+            try:
+                body = self.shared.get(key)
+            except Exception as e:
+                current_app.logger.warning(f"Shared response cache unavailable: {e}")
+            if body is not None:
+                self.local.set(key, body)
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def set(self, key, body):
+        self.local.set(key, body)
+        if self.shared is not None:
+            try:
+                self.shared.setex(key, self.ttl, body)
+            except Exception as e:
+                current_app.logger.warning(f"Shared response cache unavailable: {e}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified, 'entries': len(self.local),
+            'bytes': self.local.nbytes, 'hit_rate': self.hits / total if total else 0.0, 'shared': self.shared is not None
+        }
+
+response_cache = ResponseCache()
+
+def response_cache_key(endpoint):
+    units = json.dumps(sorted(current_user.allowed_units or []))
+    parts = [
+        endpoint, current_user.role, hashlib.sha1(units.encode('utf-8')).hexdigest(),
+        str(current_user.management_fee_percentage), str(get_data_version()),
+        json.dumps(sorted(request.args.items(multi=True)))
+    ]
+    return 'mspro:response:' + hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+def _conditional(response, etag):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached_response(endpoint):
+    """
+    Serves a JSON API view with a strong ETag derived from the cache key. A matching
+    If-None-Match gets a 304 before the view runs; otherwise the body comes from the
+    response cache when present. Only successful responses are stored.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = response_cache_key(endpoint)
+            etag = key.rsplit(':', 1)[1]
+            if request.if_none_match.contains(etag):
+                response_cache.not_modified += 1
+                return _conditional(make_response('', 304), etag)
+
+            body = response_cache.get(key)
+            if body is not None:
+                response = make_response(body)
+                response.mimetype = 'application/json'
+                return _conditional(response, etag)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response_cache.set(key, response.get_data())
+                _conditional(response, etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+from flask_login import current_user
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import Unit, Channel, Booking, Expense, MonthlyUnitRollup, MonthlyChannelRollup
+from .filters import unit_scope
+from .cache import LRUCache, get_data_version
+
+# Fact model -> [(text column, key column, dimension)]
+DIMENSION_KEYS = {
+    Booking: [('unit_name', 'unit_id', Unit), ('channel', 'channel_id', Channel)],
+    Expense: [('unit_name', 'unit_id', Unit)],
+}
+
+def dimension_ids(connection, dimension, names):
+    """Returns {name: id} for the given names, inserting the ones the dimension has not seen yet."""
+    names = {name for name in names if name}
+    if not names:
+        return {}
+    table = dimension.__table__
+    ids = dict(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(names))).all())
+    missing = names - ids.keys()
+    if missing:
+        connection.execute(insert(table), [{'name': name} for name in sorted(missing)])
+        ids.update(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(missing))).all())
+    return ids
+
+def with_dimension_keys(connection, model, frame):
+    """Adds the integer dimension keys to a normalised import frame, registering new names."""
+    import pandas as pd
+    for text_column, key_column, dimension in DIMENSION_KEYS[model]:
+        if text_column not in frame.columns:
+            continue
+        ids = dimension_ids(connection, dimension, frame[text_column].dropna().unique())
+        # Nullable integers: a plain list with blanks becomes float64 and COPY would write "1.0".
+        frame[key_column] = pd.array([ids.get(name) for name in frame[text_column]], dtype='Int64')
+    return frame
+
+@event.listens_for(Session, 'before_flush')
+def assign_dimension_keys(session, flush_context, instances):
+    """Keeps unit_id/channel_id in step with the text columns for rows written through the ORM."""
+    for model, keys in DIMENSION_KEYS.items():
+        rows = [obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, model)]
+        if not rows:
+            continue
+        connection = session.connection()
+        for text_column, key_column, dimension in keys:
+            ids = dimension_ids(connection, dimension, {getattr(obj, text_column) for obj in rows})
+            for obj in rows:
+                setattr(obj, key_column, ids.get(getattr(obj, text_column)))
+
+def unit_names():
+    """Every known unit name, for dropdowns."""
+    return [name for (name,) in Unit.query.with_entities(Unit.name).order_by(Unit.name)]
+
+_options_cache = LRUCache(256)
+
+def filter_options():
+    """
+    Years with bookings, units and channels visible to the current user, for the filter dropdowns:
+    {'years': [newest first], 'units': [...], 'channels': [...]}. Cached per worker under the data
+    version and the user's scope, so imports, edits and unit changes (which bump the version) refresh it.
+    """
+    owner = current_user.role == 'owner'
+    key = (get_data_version(), tuple(current_user.allowed_units) if owner else current_user.role)
+    options = _options_cache.get(key)
+    if options is None:
+        years = (db.session.query(MonthlyUnitRollup.year).distinct()
+                 .filter(MonthlyUnitRollup.booking_count > 0, unit_scope(MonthlyUnitRollup))
+                 .order_by(MonthlyUnitRollup.year.desc()))
+        if owner:
+            channels = (db.session.query(MonthlyChannelRollup.channel).distinct()
+                        .filter(MonthlyChannelRollup.channel.isnot(None), unit_scope(MonthlyChannelRollup)))
+        else:
+            channels = db.session.query(Channel.name)
+        options = {
+            'years': [year for (year,) in years if year],
+            'units': sorted(current_user.allowed_units) if owner else unit_names(),
+            'channels': sorted(name for (name,) in channels if name)
+        }
+        _options_cache.set(key, options)
+    return options
@@ -0,0 +1,55 @@
+import csv
+import io
+import tempfile
+
+# Column keys and headers of each report, as shown on the reports page.
+DETAILED_COLUMNS = {
+    'booking_number': '预订号', 'date': '日期', 'type': '类型', 'unit_name': '房型', 'checkin': '入住日期',
+    'checkout': '退房日期', 'channel': '渠道', 'on_offline': '在线/离线', 'pax': '人数', 'duration': '天数',
+    'price': '价格', 'cleaning_fee': '打扫费', 'platform_charge': '平台费', 'total_booking_revenue': '总收入',
+    'additional_expense_category': '额外支出类别', 'additional_expense_amount': '额外支出金额'
+}
+_SUMMARY_COLUMNS = {
+    'total_revenue': '总收入', 'total_expenses': '总支出', 'gross_profit': '毛利',
+    'management_fee': '管理费', 'net_profit': '净利润'
+}
+ANNUAL_COLUMNS = {'year': '年份', **_SUMMARY_COLUMNS}
+QUARTERLY_COLUMNS = {'季度': '季度', **_SUMMARY_COLUMNS}
+CSV_FLUSH_ROWS = 500
+
+def select_columns(requested, available):
+    """Returns the requested comma-separated column keys that exist, or every column if none do."""
+    columns = [c for c in (requested or '').split(',') if c in available]
+    return columns or list(available)
+
+def iter_csv(rows, columns, headers):
+    """
+    Yields a UTF-8 CSV (with a BOM so Excel detects the encoding) in chunks of
+    CSV_FLUSH_ROWS rows, consuming rows lazily.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([headers[c] for c in columns])
+    for count, row in enumerate(rows, 1):
+        writer.writerow([row.get(c) for c in columns])
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue()
+
+def write_xlsx(rows, columns, headers, title='Report'):
+    """
+    Writes rows to an XLSX in openpyxl's write-only mode, which streams each row to disk
+    instead of building the sheet in memory. Returns the rewound temporary file.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append([headers[c] for c in columns])
+    for row in rows:
+        sheet.append([row.get(c) for c in columns])
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
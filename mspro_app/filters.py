@@ -0,0 +1,104 @@
+from flask_login import current_user
+from sqlalchemy import and_, or_, true, select, union_all, literal, null
+from datetime import date, timedelta
+import base64
+from .models import Booking, Expense, Unit, user_unit, MAX_STAY_NIGHTS
+
+def period_bounds(year, month=None):
+    """Returns the half-open [start, end) date range covering a year or a single month."""
+    if month:
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    else:
+        start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    return start, end
+
+def owner_unit_ids():
+    """
+    SELECT of the current user's unit ids, for IN semi-joins on unit_id. Bound by user id, so
+    every owner shares one statement, and answered from the user_unit primary key alone.
+    """
+    return select(user_unit.c.unit_id).where(user_unit.c.user_id == current_user.id)
+
+def unit_scope(model, room_type=None, include_general=False):
+    """
+    Returns the owner/room type predicate for a model with unit_name and unit_id columns; both
+    are applied on the unit_id key, so they read the (unit_id, date) indexes. With include_general,
+    expenses that are not tied to a unit are kept as well (for owners: no unit_id, i.e. NULL or
+    empty unit_name; for a room type: NULL unit_name only).
+    """
+    criteria = []
+    if current_user.is_authenticated and current_user.role == 'owner':
+        allowed_units = model.unit_id.in_(owner_unit_ids())
+        criteria.append(or_(allowed_units, model.unit_id.is_(None)) if include_general else allowed_units)
+
+    if room_type and room_type != 'All':
+        if not (current_user.is_authenticated and current_user.role == 'owner') or room_type in current_user.allowed_units:
+            room = model.unit_id == select(Unit.id).where(Unit.name == room_type).scalar_subquery()
+            # Only NULL-named expenses count as general here, as before; unit_id keeps it on the index.
+            general = and_(model.unit_id.is_(None), model.unit_name.is_(None))
+            criteria.append(or_(room, general) if include_general else room)
+
+    return and_(true(), *criteria)
+
+def apply_scope(bookings_query, expenses_query, room_type=None):
+    """Applies the owner unit restrictions and the room type filter to a pair of queries."""
+    bookings_query = bookings_query.filter(unit_scope(Booking, room_type))
+    expenses_query = expenses_query.filter(unit_scope(Expense, room_type, include_general=True))
+    return bookings_query, expenses_query
+
+def apply_period(bookings_query, expenses_query, year, month=None):
+    if year:
+        start, end = period_bounds(year, month)
+        bookings_query = bookings_query.filter(Booking.checkin >= start, Booking.checkin < end)
+        expenses_query = expenses_query.filter(Expense.date >= start, Expense.date < end)
+    return bookings_query, expenses_query
+
+def booking_overlap(start, end):
+    """
+    Bookings whose stay overlaps the half-open [start, end) window (checkout is the departure day).
+    No stay is longer than MAX_STAY_NIGHTS, which gives checkin a lower bound as well.
+    """
+    return and_(Booking.checkin >= start - timedelta(days=MAX_STAY_NIGHTS), Booking.checkin < end, Booking.checkout > start)
+
+def build_filtered_queries(year, month=None, room_type=None):
+    bookings_query, expenses_query = apply_period(Booking.query, Expense.query, year, month)
+    return apply_scope(bookings_query, expenses_query, room_type)
+
+def detailed_records_query(year, month=None, room_type=None, cursor=None):
+    """
+    Returns a select over bookings and expenses merged with UNION ALL, in the shape of the
+    detailed records table and ordered by (date, id). With a cursor from encode_cursor, only
+    the rows after it are selected, so pages are read with a keyset instead of an OFFSET.
+    """
+    start, end = period_bounds(year, month)
+    bookings = select(
+        literal('booking').label('type'), Booking.id, Booking.checkin.label('date'), Booking.unit_name,
+        Booking.checkin, Booking.checkout, Booking.channel, Booking.on_offline, Booking.pax, Booking.duration,
+        Booking.price, Booking.cleaning_fee, Booking.platform_charge, Booking.total, Booking.booking_number,
+        null().label('particulars'), null().label('debit')
+    ).where(Booking.checkin >= start, Booking.checkin < end, unit_scope(Booking, room_type))
+    expenses = select(
+        literal('expense'), Expense.id, Expense.date, Expense.unit_name,
+        null(), null(), null(), null(), null(), null(),
+        null(), null(), null(), null(), null(),
+        Expense.particulars, Expense.debit
+    ).where(Expense.date >= start, Expense.date < end, unit_scope(Expense, room_type, include_general=True))
+
+    records = union_all(bookings, expenses).subquery('records')
+    query = select(records).order_by(records.c.date, records.c.id)
+    if cursor:
+        after_date, after_id = cursor
+        query = query.where(or_(records.c.date > after_date, and_(records.c.date == after_date, records.c.id > after_id)))
+    return query
+
+def encode_cursor(record):
+    return base64.urlsafe_b64encode(f"{record.date.isoformat()}|{record.id}".encode('utf-8')).decode('ascii')
+
+def decode_cursor(token):
+    """Returns the (date, id) position in an encode_cursor token; raises ValueError if it is malformed."""
+    try:
+        after_date, after_id = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8').split('|', 1)
+        return date.fromisoformat(after_date), after_id
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, DateField, SelectField, FloatField, IntegerField
 from wtforms.validators import DataRequired, ValidationError, Email, EqualTo
-from .models import User
+from .models import User, MAX_STAY_NIGHTS
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -35,6 +35,10 @@ class BookingForm(FlaskForm):
     total = FloatField('总收入', validators=[DataRequired()])
     submit = SubmitField('提交')
 
+    def validate_checkout(self, checkout):
+        if self.checkin.data and checkout.data and (checkout.data - self.checkin.data).days > MAX_STAY_NIGHTS:
+            raise ValidationError(f'入住时长不能超过 {MAX_STAY_NIGHTS} 晚。')
+
 class ExpenseForm(FlaskForm):
     date = DateField('日期', validators=[DataRequired()], format='%Y-%m-%d')
     unit_name = SelectField('房型', validators=[DataRequired()])
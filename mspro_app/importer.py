@@ -0,0 +1,374 @@
+import pandas as pd
+import numpy as np
+import glob
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .extensions import db
+from .models import Booking, Expense, ImportedFile, MAX_STAY_NIGHTS
+from .dimensions import with_dimension_keys
+from .rollups import booking_rollup_keys, expense_rollup_key
+
+BOOKING_COLUMN_MAP = {
+    'Unit Name': 'unit_name', 'CHECKIN': 'checkin', 'CHECKOUT': 'checkout',
+    'Channel': 'channel', 'ON/OFFLINE': 'on_offline', 'Booking Number': 'booking_number',
+    'Pax': 'pax', 'Duration': 'duration', 'Price': 'price',
+    'CLEANING FEE': 'cleaning_fee', 'Platform Charge': 'platform_charge', 'TOTAL': 'total'
+}
+BOOKING_NATURAL_KEY = ['booking_number', 'unit_name', 'checkin']
+BOOKING_NUMERIC_COLUMNS = ['pax', 'duration', 'price', 'cleaning_fee', 'platform_charge', 'total']
+EXPENSE_COLUMN_MAP = {'Expenses Date': 'Date', 'PARTICULARS': 'Particulars', 'DEBIT': 'Amount'}
+INSERT_BATCH_SIZE = 5000
+WORKBOOK_CACHE_DIR = '.parquet_cache'
+# Part of every cached frame's name; bump it whenever read_workbook's output changes.
+WORKBOOK_CACHE_VERSION = 1
+
+def list_booking_files(folder):
+    return sorted(f for f in glob.glob(os.path.join(folder, '*Booking.xlsx')) if not os.path.basename(f).startswith('~$'))
+
+def list_expense_files(folder):
+    return sorted(f for f in glob.glob(os.path.join(folder, '*expenses*.xlsx')) if not os.path.basename(f).startswith('~$'))
+
+def report_phase(phase, rows, seconds):
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f"  [{phase}] {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/sec)")
+
+def normalise_booking_columns(df):
+    return df.rename(columns=BOOKING_COLUMN_MAP)
+
+def normalise_expense_columns(df):
+    """Maps expense headers onto model names, tolerating the DEBIT/Amount and 'Expenses Date' variants."""
+    df = df.copy()
+    for old_col, new_col in EXPENSE_COLUMN_MAP.items():
+        if old_col in df.columns:
+            if new_col not in df.columns:
+                df[new_col] = df[old_col]
+            else:
+                df[new_col] = df[new_col].fillna(df[old_col])
+
+    df = df.rename(columns={'Unit Name': 'unit_name', 'Particulars': 'particulars', 'Amount': 'debit'})
+    df['date'] = df['Date'] if 'Date' in df.columns else pd.NaT
+    return df.drop(columns=[c for c in ('Date',) + tuple(EXPENSE_COLUMN_MAP) if c in df.columns])
+
+def _stable_types(df):
+    # Cells of different types in one column (numbers mixed with text, dates mixed with
+    # strings) are stored as text so the frame round-trips through Parquet; the numeric
+    # and date coercion downstream parses them the same way.
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype(str).where(df[col].notna(), None)
+    return df
+
+def read_workbook(path, kind):
+    """Parses one workbook into a frame with model column names but unconverted values."""
+    if kind == 'booking':
+        return _stable_types(normalise_booking_columns(pd.read_excel(path, engine='calamine', dtype={'Booking Number': str})))
+    return _stable_types(normalise_expense_columns(pd.read_excel(path, engine='calamine')))
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _cache_name(kind, sha256):
+    return f'{kind}-v{WORKBOOK_CACHE_VERSION}-{sha256}.parquet'
+
+def load_workbook(path, kind, cache_dir=None):
+    """
+    Returns read_workbook(path, kind), served from a Parquet file keyed by the cache format
+    version and the workbook's content hash when cache_dir is set. Only new or edited
+    workbooks pay the Excel parsing cost.
+    """
+    if not cache_dir or not parquet_available():
+        frame = read_workbook(path, kind)
+    else:
+        cached = os.path.join(cache_dir, _cache_name(kind, _sha256(path)))
+        if os.path.exists(cached):
+            frame = pd.read_parquet(cached)
+        else:
+            frame = read_workbook(path, kind)
+            os.makedirs(cache_dir, exist_ok=True)
+            partial = f'{cached}.{os.getpid()}.tmp'
+            frame.to_parquet(partial, index=False)
+            os.replace(partial, cached)
+    return frame.assign(source_file=os.path.basename(path))
+
+def prune_workbook_cache(cache_dir):
+    """
+    Removes cached frames no recorded workbook refers to: older format versions and the
+    previous contents of edited or deleted workbooks. Returns how many were removed.
+    """
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    keep = {_cache_name(f.kind, f.sha256) for f in ImportedFile.query}
+    removed = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.parquet') and entry.name not in keep:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+def _model_frame(df, model):
+    columns = [c.name for c in model.__table__.columns if c.name in df.columns]
+    frame = df[columns].copy()
+    # Text columns may hold NaN for blank cells; the database wants NULL.
+    for col in frame.columns:
+        if frame[col].dtype == object:
+            frame[col] = frame[col].astype(object).where(frame[col].notna(), None)
+    return frame
+
+def _digest(frame, columns, prefix):
+    joined = pd.Series(prefix, index=frame.index)
+    for col in columns:
+        joined = joined + '\x1f' + frame[col].astype(str)
+    return [hashlib.sha1(value.encode('utf-8')).hexdigest() for value in joined]
+
+def _row_keys(frame, columns, prefix='row'):
+    # Identical rows or natural keys within one workbook are legitimate (e.g. two equal
+    # expenses on a day), so the occurrence number is part of the hash.
+    columns = ['source_file'] + columns
+    keyed = frame[columns].copy()
+    keyed['_occurrence'] = frame.groupby(columns, dropna=False, sort=False).cumcount()
+    return _digest(keyed, columns + ['_occurrence'], prefix)
+
+def _with_source_keys(frame, natural_columns=None):
+    """
+    Adds the source_key upsert key, scoped to the row's workbook: a hash of the natural key
+    columns when they are all present, otherwise a hash of the whole row. Repeats are
+    numbered, so every row is kept.
+    """
+    data_columns = [c for c in frame.columns if c not in ('id', 'source_file', 'source_key')]
+    keys = np.empty(len(frame), dtype=object)
+    natural = np.zeros(len(frame), dtype=bool)
+    if natural_columns:
+        natural = frame[natural_columns].notna().all(axis=1).to_numpy()
+        natural &= (frame[natural_columns[0]].astype(str).str.strip() != '').to_numpy()
+        if natural.any():
+            keys[natural] = _row_keys(frame[natural], natural_columns, 'natural')
+    if (~natural).any():
+        keys[~natural] = _row_keys(frame[~natural], data_columns)
+    frame['source_key'] = keys
+    return frame
+
+def normalise_bookings(df):
+    """Converts a booking frame from read_workbook into Booking rows, vectorised over the whole frame."""
+    df = df.copy()
+    for col in BOOKING_NUMERIC_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    df['pax'] = df['pax'].astype(int)
+    df['duration'] = df['duration'].astype(int)
+
+    for col in ('checkin', 'checkout'):
+        if col not in df.columns:
+            df[col] = pd.NaT
+    df['checkin'] = pd.to_datetime(df['checkin'], errors='coerce')
+    df['checkout'] = pd.to_datetime(df['checkout'], errors='coerce')
+    df = df.dropna(subset=['checkin', 'checkout'])
+    too_long = (df['checkout'] - df['checkin']).dt.days > MAX_STAY_NIGHTS
+    if too_long.any():
+        # Stay overlap queries would miss these nights, so refuse the workbook like the preflight does
+        raise ValueError(f"{int(too_long.sum())} bookings stay longer than {MAX_STAY_NIGHTS} nights, "
+                         f"first at check-in {df.loc[too_long, 'checkin'].iloc[0].date()}")
+    df['checkin'] = df['checkin'].dt.date
+    df['checkout'] = df['checkout'].dt.date
+
+    return _with_source_keys(_model_frame(df, Booking), BOOKING_NATURAL_KEY)
+
+def normalise_expenses(df):
+    """Converts an expense frame from read_workbook into Expense rows."""
+    df = df.copy()
+    if 'debit' not in df.columns:
+        df['debit'] = np.nan
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['debit'] = pd.to_numeric(df['debit'], errors='coerce').fillna(0)
+    df = df.dropna(subset=['date', 'debit'])
+    df['date'] = df['date'].dt.date
+
+    return _with_source_keys(_model_frame(df, Expense))
+
+def _copy_frame(table_name, frame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ', '.join(f'"{c}"' for c in frame.columns)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+def _insert_frame(table, frame):
+    records = frame.to_dict('records')
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        db.session.execute(insert(table), records[start:start + INSERT_BATCH_SIZE])
+
+def bulk_load(model, frame):
+    """
+    Loads a normalised frame into the model's table inside the current session transaction:
+    COPY FROM STDIN on PostgreSQL, batched executemany INSERTs elsewhere (SQLite).
+    """
+    if frame.empty:
+        return 0
+    table = model.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        _copy_frame(table.name, frame)
+    else:
+        _insert_frame(table, frame)
+    return len(frame)
+
+def _upsert_postgresql(table, frame):
+    stage = f'{table.name}_import_stage'
+    columns = ', '.join(f'"{c}"' for c in frame.columns)
+    updates = ', '.join(f'"{c}" = EXCLUDED."{c}"' for c in frame.columns if c not in ('id', 'source_key'))
+    connection = db.session.connection()
+    connection.exec_driver_sql(f'CREATE TEMP TABLE "{stage}" (LIKE "{table.name}" INCLUDING DEFAULTS) ON COMMIT DROP')
+    _copy_frame(stage, frame)
+    connection.exec_driver_sql(
+        f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{stage}" '
+        f'ON CONFLICT (source_key) DO UPDATE SET {updates}'
+    )
+    connection.exec_driver_sql(f'DROP TABLE "{stage}"')
+
+def _upsert_sqlite(table, frame):
+    records = frame.to_dict('records')
+    for start in range(0, len(records), INSERT_BATCH_SIZE):
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['source_key'],
+            set_={c: statement.excluded[c] for c in frame.columns if c not in ('id', 'source_key')}
+        )
+        db.session.execute(statement, records[start:start + INSERT_BATCH_SIZE])
+
+def _delete_in_chunks(model, column, values):
+    values = list(values)
+    for start in range(0, len(values), INSERT_BATCH_SIZE):
+        db.session.query(model).filter(column.in_(values[start:start + INSERT_BATCH_SIZE])).delete(synchronize_session=False)
+
+def upsert_load(model, frame, files):
+    """
+    Synchronises the rows of the given workbooks: rows that disappeared from them are
+    deleted, the rest are upserted on source_key (COPY into a staging table plus
+    INSERT ... ON CONFLICT on PostgreSQL, INSERT ... ON CONFLICT batches on SQLite).
+    """
+    files = [os.path.basename(f) for f in files]
+    existing = {k for (k,) in db.session.query(model.source_key).filter(model.source_file.in_(files))}
+    _delete_in_chunks(model, model.source_key, existing - set(frame['source_key']))
+    if frame.empty:
+        return 0
+    if db.session.get_bind().dialect.name == 'postgresql':
+        _upsert_postgresql(model.__table__, frame)
+    else:
+        _upsert_sqlite(model.__table__, frame)
+    return len(frame)
+
+def parse_workbook(path, kind, cache_dir=None):
+    """Reads and normalises one workbook. Runs inside the parse worker processes."""
+    normalise = normalise_bookings if kind == 'booking' else normalise_expenses
+    frame = normalise(load_workbook(path, kind, cache_dir))
+    frame.insert(0, 'id', [str(uuid.uuid4()) for _ in range(len(frame))])
+    return path, frame
+
+def parse_workbooks(files, kind, jobs=1, cache_dir=None):
+    """
+    Yields (path, frame) for every workbook in file order. With jobs > 1 the workbooks are
+    parsed concurrently in a process pool, and each frame is yielded as soon as it and all
+    the files before it are ready, so loading overlaps with parsing.
+    """
+    if jobs <= 1 or len(files) <= 1:
+        for path in files:
+            yield parse_workbook(path, kind, cache_dir)
+        return
+    # 'spawn' keeps the workers from inheriting the parent's open database connections.
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield from executor.map(parse_workbook, files, [kind] * len(files), [cache_dir] * len(files))
+
+def import_workbooks(model, kind, files, jobs=1, incremental=False, cache_dir=None):
+    """Streams parsed workbooks into the load stage, reporting throughput for both stages."""
+    parsed = loaded = 0
+    load_seconds = 0.0
+    started = time.perf_counter()
+    for path, frame in parse_workbooks(files, kind, jobs, cache_dir):
+        parsed += len(frame)
+        load_started = time.perf_counter()
+        frame = with_dimension_keys(db.session.connection(), model, frame)
+        if incremental:
+            loaded += upsert_load(model, frame, [path])
+        else:
+            loaded += bulk_load(model, frame)
+        load_seconds += time.perf_counter() - load_started
+    report_phase(f'parse x{jobs}', parsed, time.perf_counter() - started - load_seconds)
+    report_phase('load', loaded, load_seconds)
+    return loaded
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def has_import_history():
+    return db.session.query(ImportedFile.file_name).first() is not None
+
+def plan_incremental(kind, files):
+    """
+    Compares the workbooks on disk with the recorded fingerprints. A file whose mtime and
+    size are unchanged is skipped without hashing; otherwise its content hash decides.
+    Returns (changed_files, removed_file_names).
+    """
+    recorded = {f.file_name: f for f in ImportedFile.query.filter_by(kind=kind)}
+    changed = []
+    for path in files:
+        stat = os.stat(path)
+        known = recorded.pop(os.path.basename(path), None)
+        if known and known.mtime == stat.st_mtime and known.size == stat.st_size:
+            continue
+        if known and known.sha256 == _sha256(path):
+            known.mtime, known.size = stat.st_mtime, stat.st_size
+            continue
+        changed.append(path)
+    return changed, sorted(recorded)
+
+def stored_rollup_keys(model, file_names):
+    """The (unit, year, month) rollup buckets the stored rows of the given workbooks contribute to."""
+    file_names = [os.path.basename(f) for f in file_names]
+    if not file_names:
+        return set()
+    if model is Booking:
+        rows = db.session.query(Booking.unit_name, Booking.checkin, Booking.checkout).filter(Booking.source_file.in_(file_names)).distinct()
+        return {key for row in rows for key in booking_rollup_keys(row)}
+    rows = db.session.query(Expense.unit_name, Expense.date).filter(Expense.source_file.in_(file_names)).distinct()
+    return {key for key in map(expense_rollup_key, rows) if key}
+
+def remove_files(model, file_names):
+    """Deletes the rows and fingerprints of workbooks that no longer exist."""
+    if not file_names:
+        return 0
+    removed = db.session.query(model).filter(model.source_file.in_(file_names)).delete(synchronize_session=False)
+    db.session.query(ImportedFile).filter(ImportedFile.file_name.in_(file_names)).delete(synchronize_session=False)
+    return removed
+
+def record_fingerprints(kind, files):
+    for path in files:
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        db.session.merge(ImportedFile(
+            file_name=name, kind=kind, mtime=stat.st_mtime, size=stat.st_size,
+            sha256=_sha256(path), imported_at=datetime.utcnow()
+        ))
@@ -5,13 +5,40 @@ import uuid
 from flask import current_app
 from itsdangerous import URLSafeTimedSerializer as Serializer
 import time
+from datetime import datetime
+
+# Which units an owner may see. The primary key serves lookups by user; the unit_id index the reverse.
+user_unit = db.Table('user_unit',
+    db.Column('user_id', db.String(80), db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('unit_id', db.Integer, db.ForeignKey('unit.id', ondelete='CASCADE'), primary_key=True, index=True)
+)
+
+class Unit(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+    users = db.relationship('User', secondary=user_unit, back_populates='units')
+
+class Channel(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False, unique=True)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.String(80), primary_key=True)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(80), nullable=False, default='owner')
-    allowed_units = db.Column(db.JSON, nullable=True, default=[])
     management_fee_percentage = db.Column(db.Float, nullable=False, default=30.0)
+    units = db.relationship('Unit', secondary=user_unit, order_by='Unit.name', back_populates='users')
+
+    @property
+    def allowed_units(self):
+        return [unit.name for unit in self.units]
+
+    @allowed_units.setter
+    def allowed_units(self, names):
+        """Assigns units by name, creating Unit rows for names not seen before."""
+        names = list(dict.fromkeys(name for name in names or [] if name))
+        units = {unit.name: unit for unit in Unit.query.filter(Unit.name.in_(names))} if names else {}
+        self.units = [units.get(name) or Unit(name=name) for name in names]
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -37,10 +64,17 @@ class User(UserMixin, db.Model):
         return User.query.get(user_id)
 
 
+# Longest stay a booking may span. Stay overlap queries bound checkin by it, so they read an
+# index range instead of every earlier booking; the booking form and the importer enforce it.
+MAX_STAY_NIGHTS = 365
+
 class Booking(db.Model):
+    # Owner and room filters are on unit_id; also serves the (unit_id, checkin) lookups through its prefix.
+    __table_args__ = (db.Index('ix_booking_unit_id_checkin_checkout', 'unit_id', 'checkin', 'checkout'),)
+
     id = db.Column(db.String(80), primary_key=True, default=lambda: str(uuid.uuid4()))
     unit_name = db.Column(db.String(120))
-    checkin = db.Column(db.Date)
+    checkin = db.Column(db.Date, index=True)
     checkout = db.Column(db.Date)
     channel = db.Column(db.String(80))
     on_offline = db.Column(db.String(80))
@@ -51,10 +85,91 @@ class Booking(db.Model):
     cleaning_fee = db.Column(db.Float)
     platform_charge = db.Column(db.Float)
     total = db.Column(db.Float)
+    source_key = db.Column(db.String(64), unique=True, index=True)
+    source_file = db.Column(db.String(255))
+    # Dimension keys, kept in step with unit_name/channel by dimensions.py
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id'))
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'))
 
 class Expense(db.Model):
+    __table_args__ = (db.Index('ix_expense_unit_id_date', 'unit_id', 'date'),)
+
     id = db.Column(db.String(80), primary_key=True, default=lambda: str(uuid.uuid4()))
-    date = db.Column(db.Date)
+    date = db.Column(db.Date, index=True)
     unit_name = db.Column(db.String(120))
     particulars = db.Column(db.String(200))
-    debit = db.Column(db.Float)
\ No newline at end of file
+    debit = db.Column(db.Float)
+    source_key = db.Column(db.String(64), unique=True, index=True)
+    source_file = db.Column(db.String(255))
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id'))
+
+class ImportedFile(db.Model):
+    __tablename__ = 'imported_file'
+
+    file_name = db.Column(db.String(255), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    mtime = db.Column(db.Float, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    imported_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class MonthlyUnitRollup(db.Model):
+    __tablename__ = 'monthly_unit_rollup'
+    __table_args__ = (db.Index('ix_monthly_unit_rollup_key', 'unit_name', 'year', 'month'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    unit_name = db.Column(db.String(120))
+    # Key of unit_name, for owner scoping; rollups are derived, so there is no foreign key
+    unit_id = db.Column(db.Integer, index=True)
+    year = db.Column(db.Integer, nullable=False, index=True)
+    month = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    cleaning_fees = db.Column(db.Float, nullable=False, default=0.0)
+    platform_charges = db.Column(db.Float, nullable=False, default=0.0)
+    # Nights stayed within this month (stays crossing a month boundary are split) and the
+    # share of those stays' revenue that falls on them; the other metrics follow checkin month.
+    occupied_nights = db.Column(db.Integer, nullable=False, default=0)
+    night_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+    expenses = db.Column(db.Float, nullable=False, default=0.0)
+
+class MonthlyChannelRollup(db.Model):
+    __tablename__ = 'monthly_channel_rollup'
+    __table_args__ = (db.Index('ix_monthly_channel_rollup_key', 'unit_name', 'year', 'month'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    unit_name = db.Column(db.String(120))
+    unit_id = db.Column(db.Integer, index=True)
+    year = db.Column(db.Integer, nullable=False, index=True)
+    month = db.Column(db.Integer, nullable=False)
+    channel = db.Column(db.String(80))
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    booking_count = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class PeriodVersion(db.Model):
+    __tablename__ = 'period_version'
+
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class StatementJob(db.Model):
+    __tablename__ = 'statement_job'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(80), db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    batch_id = db.Column(db.String(36), index=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    room_type = db.Column(db.String(120), nullable=False, default='All')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    file_path = db.Column(db.String(500))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
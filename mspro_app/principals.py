@@ -0,0 +1,49 @@
+from flask_login import UserMixin
+import time
+from .extensions import db
+from .models import User
+from .cache import LRUCache
+
+class Principal(UserMixin):
+    """
+    Snapshot of the User fields requests read through current_user: id, role, allowed_units and
+    the management fee. Shared between requests, so treat it as read-only; load the User row to change it.
+    """
+    def __init__(self, user):
+        self.id = user.id
+        self.role = user.role
+        self.allowed_units = list(user.allowed_units or [])
+        self.management_fee_percentage = user.management_fee_percentage
+
+    def get_id(self):
+        return self.id
+
+class PrincipalCache:
+    """
+    Per-worker LRU of Principals for login_manager.user_loader, so authenticated requests skip the
+    user lookup. Writes to a user invalidate its entry in the worker that made them; other workers
+    pick the change up once their entry's TTL runs out, so PRINCIPAL_CACHE_TTL is the revocation window.
+    """
+    def __init__(self):
+        self.entries = LRUCache(256)
+        self.ttl = 60
+
+    def init_app(self, app):
+        self.entries = LRUCache(app.config.get('PRINCIPAL_CACHE_SIZE', 256))
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', 60)
+
+    def load(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        principal = Principal(user)
+        self.entries.set(user_id, (time.monotonic() + self.ttl, principal))
+        return principal
+
+    def invalidate(self, user_id):
+        self.entries.delete(user_id)
+
+principal_cache = PrincipalCache()
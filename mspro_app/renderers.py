@@ -0,0 +1,92 @@
+from flask import current_app, render_template
+import io
+import math
+
+def _money(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        value = 0
+    return '%.2f' % value
+
+class PdfkitRenderer:
+    """Renders pdf_template.html with wkhtmltopdf, which runs as a subprocess per statement."""
+    name = 'pdfkit'
+
+    def render(self, context):
+        import pdfkit
+        return pdfkit.from_string(render_template('pdf_template.html', **context), False)
+
+class ReportLabRenderer:
+    """
+    Lays out the same statement in-process with ReportLab. The built-in STSong-Light CID font
+    covers the Chinese labels without shipping a font file.
+    """
+    name = 'reportlab'
+    font = 'STSong-Light'
+
+    def __init__(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        pdfmetrics.registerFont(UnicodeCIDFont(self.font))
+
+    def _table(self, rows, widths=None, header=True):
+        from reportlab.lib import colors
+        from reportlab.platypus import Table, TableStyle
+        style = [
+            ('FONT', (0, 0), (-1, -1), self.font, 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dddddd')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]
+        if header:
+            style.append(('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f2f2f2')))
+        return Table(rows, colWidths=widths, repeatRows=1 if header else 0, style=TableStyle(style))
+
+    def render(self, context):
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+        title = ParagraphStyle('title', fontName=self.font, fontSize=16, leading=22, alignment=1, textColor=colors.HexColor('#28a745'))
+        heading = ParagraphStyle('heading', fontName=self.font, fontSize=12, leading=18, spaceBefore=10)
+        footer = ParagraphStyle('footer', fontName=self.font, fontSize=8, alignment=1, textColor=colors.HexColor('#777777'))
+        summary = context['summary']
+
+        story = [
+            Paragraph(f"{context['year']}年{context['month']}月 财务月结单", title),
+            Paragraph(f"房型: {context['room_type']}", title),
+            Paragraph('财务总览', heading),
+            self._table([
+                ['预订总收入', f"{_money(summary['total_booking_revenue'])} MYR"],
+                ['月度总支出', f"{_money(summary['total_monthly_expenses'])} MYR"],
+                ['毛利', f"{_money(summary['gross_profit'])} MYR"],
+                [f"管理费 ({'%.1f' % (summary['fee_rate'] or 30.0)}%)", f"{_money(summary['management_fee'])} MYR"],
+                ['当月净收入', f"{_money(summary['monthly_income'])} MYR"],
+                ['入住率', f"{_money(summary['total_occupancy_rate'])}%"],
+            ], widths=[150, 330], header=False),
+            Paragraph('预订记录', heading),
+        ]
+        bookings = [['预订号', '入住日期', '退房日期', '天数', '渠道', '价格', '打扫费', '平台费', '总计']]
+        bookings += [[b.booking_number or '-', str(b.checkin), str(b.checkout), b.duration, b.channel or '',
+                      _money(b.price), _money(b.cleaning_fee), _money(b.platform_charge), _money(b.total)]
+                     for b in context['bookings']] or [['本月无预订记录。'] + [''] * 8]
+        story += [self._table(bookings), Paragraph('支出记录', heading)]
+        expenses = [['日期', '描述', '金额']]
+        expenses += [[str(e.date), e.particulars or '', _money(e.debit)] for e in context['expenses']] or [['本月无支出记录。', '', '']]
+        story += [self._table(expenses, widths=[90, 300, 90]), Spacer(1, 20),
+                  Paragraph(f"报告生成于: {context['generation_time']}", footer)]
+
+        output = io.BytesIO()
+        SimpleDocTemplate(output, pagesize=A4, title='月结单').build(story)
+        return output.getvalue()
+
+RENDERERS = {renderer.name: renderer for renderer in (PdfkitRenderer, ReportLabRenderer)}
+_instances = {}
+
+def get_renderer(name=None):
+    """Returns the statement renderer selected by STATEMENT_RENDERER (or by name)."""
+    name = name or current_app.config.get('STATEMENT_RENDERER', 'pdfkit')
+    if name not in RENDERERS:
+        raise ValueError(f"Unknown statement renderer: {name}")
+    if name not in _instances:
+        _instances[name] = RENDERERS[name]()
+    return _instances[name]
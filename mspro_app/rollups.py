@@ -0,0 +1,215 @@
+from sqlalchemy import and_, extract, func, insert, or_
+from datetime import date
+import math
+from .extensions import db
+from .models import Booking, Expense, Unit, MonthlyUnitRollup, MonthlyChannelRollup
+from .aggregation import nan_safe_sum
+from .filters import period_bounds, booking_overlap
+from .cache import lock_data_version
+from .dimensions import dimension_ids
+
+REFRESH_CHUNK_SIZE = 200
+UNIT_METRICS = ('revenue', 'cleaning_fees', 'platform_charges', 'occupied_nights', 'night_revenue', 'booking_count', 'expenses')
+
+def _unit_equals(column, unit_name):
+    return column.is_(None) if unit_name is None else column == unit_name
+
+def _fact_unit_equals(model, unit_name, unit_ids):
+    """Matches a Booking/Expense unit on the indexed unit_id (NULL for a name without a Unit), keeping the name test."""
+    return and_(model.unit_id == unit_ids.get(unit_name), _unit_equals(model.unit_name, unit_name))
+
+def _empty_unit_row():
+    return {metric: 0 for metric in UNIT_METRICS}
+
+def booking_rollup_keys(booking):
+    """The (unit, year, month) buckets a booking contributes to: its checkin month and every month its stay runs into."""
+    if booking is None or booking.checkin is None:
+        return []
+    keys = [(booking.unit_name, booking.checkin.year, booking.checkin.month)]
+    year, month = booking.checkin.year, booking.checkin.month
+    while booking.checkout is not None:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        if date(year, month, 1) >= booking.checkout:
+            break
+        keys.append((booking.unit_name, year, month))
+    return keys
+
+def expense_rollup_key(expense):
+    if expense is None or expense.date is None:
+        return None
+    return (expense.unit_name, expense.date.year, expense.date.month)
+
+def split_stays(stays):
+    """
+    Splits stays into the nights they occupy in each calendar month, so a stay crossing a month
+    (or year) boundary counts toward both. Revenue is spread evenly over the stay's nights.
+    Takes (unit_name, checkin, checkout, total) rows and returns {(unit, year, month): (nights, revenue)}.
+    Vectorised: every stay is expanded into one segment per month it touches with numpy date arithmetic.
+    """
+    stays = [s for s in stays if s[1] is not None and s[2] is not None and s[2] > s[1]]
+    if not stays:
+        return {}
+    import numpy as np  # kept out of worker startup; only writes and rebuilds get here
+    units, checkin, checkout, total = zip(*stays)
+    unit_codes = {}
+    unit = np.array([unit_codes.setdefault(u, len(unit_codes)) for u in units])
+    checkin = np.array(checkin, dtype='datetime64[D]')
+    checkout = np.array(checkout, dtype='datetime64[D]')
+    total = np.nan_to_num(np.array(total, dtype=float))
+    nights = (checkout - checkin).astype(int)
+
+    first = checkin.astype('datetime64[M]')
+    last = (checkout - np.timedelta64(1, 'D')).astype('datetime64[M]')
+    span = (last - first).astype(int) + 1
+    stay = np.repeat(np.arange(len(span)), span)
+    month = first[stay] + (np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span))
+    start = np.maximum(checkin[stay], month.astype('datetime64[D]'))
+    end = np.minimum(checkout[stay], (month + 1).astype('datetime64[D]'))
+    segment_nights = (end - start).astype(int)
+    segment_revenue = total[stay] * segment_nights / nights[stay]
+
+    month_index = month.astype(int)
+    base, width = int(month_index.min()), int(month_index.max() - month_index.min()) + 1
+    buckets, inverse = np.unique(unit[stay] * width + (month_index - base), return_inverse=True)
+    bucket_nights = np.bincount(inverse, weights=segment_nights)
+    bucket_revenue = np.bincount(inverse, weights=segment_revenue)
+
+    names = {code: name for name, code in unit_codes.items()}
+    result = {}
+    for bucket, n, revenue in zip(buckets.tolist(), bucket_nights.tolist(), bucket_revenue.tolist()):
+        code, offset = divmod(bucket, width)
+        year, month_of_year = divmod(base + offset, 12)
+        result[(names[code], 1970 + year, month_of_year + 1)] = (int(n), revenue)
+    return result
+
+def compute_rollups(keys=None):
+    """
+    Aggregates the raw Booking and Expense rows into rollup rows. Revenue, fees and counts are
+    bucketed by checkin month; occupied nights and night revenue by the month each night falls in.
+    With keys, only the given (unit_name, year, month) buckets are computed; otherwise the whole history is.
+    Returns ({(unit, year, month): metrics}, {(unit, year, month, channel): metrics}).
+    """
+    booking_year, booking_month = extract('year', Booking.checkin), extract('month', Booking.checkin)
+    expense_year, expense_month = extract('year', Expense.date), extract('month', Expense.date)
+
+    bookings_query = db.session.query(
+        Booking.unit_name, booking_year, booking_month, Booking.channel,
+        nan_safe_sum(Booking.total), nan_safe_sum(Booking.cleaning_fee), nan_safe_sum(Booking.platform_charge),
+        func.count(Booking.id)
+    ).filter(Booking.checkin.isnot(None))
+    stays_query = db.session.query(Booking.unit_name, Booking.checkin, Booking.checkout, Booking.total).filter(
+        Booking.checkin.isnot(None), Booking.checkout > Booking.checkin
+    )
+    expenses_query = db.session.query(
+        Expense.unit_name, expense_year, expense_month, nan_safe_sum(Expense.debit)
+    ).filter(Expense.date.isnot(None))
+
+    if keys is not None:
+        keys = {k for k in keys if k}
+        if not keys:
+            return {}, {}
+        names = {unit_name for unit_name, _, _ in keys if unit_name}
+        unit_ids = dict(db.session.query(Unit.name, Unit.id).filter(Unit.name.in_(names))) if names else {}
+        booking_criteria, stay_criteria, expense_criteria = [], [], []
+        for unit_name, year, month in keys:
+            start, end = period_bounds(year, month)
+            booking_criteria.append(and_(_fact_unit_equals(Booking, unit_name, unit_ids), Booking.checkin >= start, Booking.checkin < end))
+            stay_criteria.append(and_(_fact_unit_equals(Booking, unit_name, unit_ids), booking_overlap(start, end)))
+            expense_criteria.append(and_(_fact_unit_equals(Expense, unit_name, unit_ids), Expense.date >= start, Expense.date < end))
+        bookings_query = bookings_query.filter(or_(*booking_criteria))
+        stays_query = stays_query.filter(or_(*stay_criteria))
+        expenses_query = expenses_query.filter(or_(*expense_criteria))
+
+    unit_rows, channel_rows = {}, {}
+    booking_groups = bookings_query.group_by(Booking.unit_name, booking_year, booking_month, Booking.channel)
+    for unit_name, year, month, channel, revenue, cleaning_fees, platform_charges, count in booking_groups:
+        key = (unit_name, int(year), int(month))
+        row = unit_rows.setdefault(key, _empty_unit_row())
+        row['revenue'] += revenue
+        row['cleaning_fees'] += cleaning_fees
+        row['platform_charges'] += platform_charges
+        row['booking_count'] += count
+        channel_rows[key + (channel,)] = {'revenue': revenue, 'booking_count': count}
+
+    for key, (nights, night_revenue) in split_stays(stays_query.all()).items():
+        # A stay overlapping a requested month can also spill into months that were not requested.
+        if keys is None or key in keys:
+            row = unit_rows.setdefault(key, _empty_unit_row())
+            row['occupied_nights'] += nights
+            row['night_revenue'] += night_revenue
+
+    for unit_name, year, month, debit in expenses_query.group_by(Expense.unit_name, expense_year, expense_month):
+        key = (unit_name, int(year), int(month))
+        unit_rows.setdefault(key, _empty_unit_row())['expenses'] += debit
+
+    return unit_rows, channel_rows
+
+def _write_rollups(unit_rows, channel_rows):
+    unit_ids = dimension_ids(db.session.connection(), Unit, {key[0] for key in unit_rows} | {key[0] for key in channel_rows})
+    if unit_rows:
+        db.session.execute(insert(MonthlyUnitRollup), [
+            dict(unit_name=unit_name, unit_id=unit_ids.get(unit_name), year=year, month=month, **metrics)
+            for (unit_name, year, month), metrics in unit_rows.items()
+        ])
+    if channel_rows:
+        db.session.execute(insert(MonthlyChannelRollup), [
+            dict(unit_name=unit_name, unit_id=unit_ids.get(unit_name), year=year, month=month, channel=channel, **metrics)
+            for (unit_name, year, month, channel), metrics in channel_rows.items()
+        ])
+
+def refresh_rollups(*keys):
+    """
+    Recomputes the rollup buckets touched by a write. Runs inside the caller's session
+    so the rollups are committed (or rolled back) together with the Booking/Expense change.
+    """
+    keys = list({k for k in keys if k})
+    if not keys:
+        return
+    lock_data_version()
+    db.session.flush()
+    # Imports can touch many buckets; chunking keeps the OR lists within SQLite's expression depth.
+    for start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+        chunk = keys[start:start + REFRESH_CHUNK_SIZE]
+        for model in (MonthlyUnitRollup, MonthlyChannelRollup):
+            criteria = [and_(_unit_equals(model.unit_name, unit_name), model.year == year, model.month == month) for unit_name, year, month in chunk]
+            db.session.query(model).filter(or_(*criteria)).delete(synchronize_session=False)
+        _write_rollups(*compute_rollups(chunk))
+
+def rebuild_rollups():
+    """Drops every rollup row and recomputes them from the raw data. Does not commit."""
+    lock_data_version()
+    db.session.query(MonthlyUnitRollup).delete(synchronize_session=False)
+    db.session.query(MonthlyChannelRollup).delete(synchronize_session=False)
+    unit_rows, channel_rows = compute_rollups()
+    _write_rollups(unit_rows, channel_rows)
+    return len(unit_rows), len(channel_rows)
+
+def _close(a, b):
+    return math.isclose(a or 0, b or 0, rel_tol=1e-9, abs_tol=0.005)
+
+def check_rollups():
+    """Compares the stored rollups with the raw data and returns a list of mismatch descriptions."""
+    expected_units, expected_channels = compute_rollups()
+
+    stored_units = {}
+    for r in MonthlyUnitRollup.query.all():
+        row = stored_units.setdefault((r.unit_name, r.year, r.month), _empty_unit_row())
+        for metric in UNIT_METRICS:
+            row[metric] += getattr(r, metric) or 0
+    stored_channels = {}
+    for r in MonthlyChannelRollup.query.all():
+        row = stored_channels.setdefault((r.unit_name, r.year, r.month, r.channel), {'revenue': 0, 'booking_count': 0})
+        row['revenue'] += r.revenue or 0
+        row['booking_count'] += r.booking_count or 0
+
+    problems = []
+    for label, expected, stored in (('unit', expected_units, stored_units), ('channel', expected_channels, stored_channels)):
+        for key in sorted(set(expected) | set(stored), key=str):
+            want, have = expected.get(key), stored.get(key)
+            if want is None or have is None:
+                problems.append(f"{label} rollup {key}: {'missing' if have is None else 'unexpected'}")
+                continue
+            for metric in want:
+                if not _close(want[metric], have[metric]):
+                    problems.append(f"{label} rollup {key} {metric}: stored {have[metric]}, raw {want[metric]}")
+    return problems
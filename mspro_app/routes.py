@@ -1,93 +1,36 @@
-from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, Response, stream_with_context, send_file
 from flask_login import login_user, logout_user, login_required, current_user
 from .extensions import db
-from .models import User, Booking, Expense
+from .models import User, Unit, Booking, Expense, StatementJob, user_unit
+from .filters import booking_overlap, unit_scope, period_bounds, detailed_records_query, encode_cursor, decode_cursor
+from .aggregation import monthly_totals, calculate_dashboard_data, dashboard_data, revenue_by_channel, period_summaries
+from .rollups import refresh_rollups, booking_rollup_keys, expense_rollup_key
+from .cache import cached_response, bump_data_version, response_cache
+from .principals import principal_cache
+from .dimensions import filter_options
+from .statements import cached_statement, statement_queue
+from .export import DETAILED_COLUMNS, ANNUAL_COLUMNS, QUARTERLY_COLUMNS, select_columns, iter_csv, write_xlsx
 from .forms import LoginForm, RegistrationForm, BookingForm, ExpenseForm, PasswordResetForm, ChangePasswordForm
-import pandas as pd
-import numpy as np
-from datetime import datetime
+from datetime import datetime, date
 import calendar
-from sqlalchemy import extract, func, or_
 import math
-import pdfkit
+import json
+import os
+import uuid
 import logging
 
 logging.basicConfig(level=logging.INFO)
 main = Blueprint('main', __name__)
 
+DETAILED_PAGE_SIZE = 200
+DETAILED_PAGE_MAX = 1000
+DETAILED_STREAM_BATCH = 1000
+
 def clean_nan(value, default=0):
     if value is None or (isinstance(value, (float, int)) and math.isnan(value)):
         return default
     return value
 
-def get_filtered_data(year, month=None, room_type=None):
-    bookings_query = Booking.query
-    expenses_query = Expense.query
-
-    if current_user.is_authenticated and current_user.role == 'owner':
-        allowed_units = current_user.allowed_units or []
-        bookings_query = bookings_query.filter(Booking.unit_name.in_(allowed_units))
-        expenses_query = expenses_query.filter(
-            or_(Expense.unit_name.in_(allowed_units), Expense.unit_name.is_(None), Expense.unit_name == '')
-        )
-
-    if year:
-        bookings_query = bookings_query.filter(extract('year', Booking.checkin) == year)
-        expenses_query = expenses_query.filter(extract('year', Expense.date) == year)
-    if month:
-        bookings_query = bookings_query.filter(extract('month', Booking.checkin) == month)
-        expenses_query = expenses_query.filter(extract('month', Expense.date) == month)
-
-    if room_type and room_type != 'All':
-        if current_user.is_authenticated and current_user.role == 'owner':
-            if room_type in current_user.allowed_units:
-                bookings_query = bookings_query.filter(Booking.unit_name == room_type)
-                expenses_query = expenses_query.filter(or_(Expense.unit_name == room_type, Expense.unit_name.is_(None)))
-        else:
-            bookings_query = bookings_query.filter(Booking.unit_name == room_type)
-            expenses_query = expenses_query.filter(or_(Expense.unit_name == room_type, Expense.unit_name.is_(None)))
-
-    return bookings_query.all(), expenses_query.all()
-
-def calculate_dashboard_data(bookings, expenses, year, month, room_type):
-    total_booking_revenue = sum(clean_nan(b.total) for b in bookings)
-    total_monthly_expenses = sum(clean_nan(e.debit) for e in expenses)
-    gross_profit = total_booking_revenue - total_monthly_expenses
-    
-    fee_rate = 30.0
-    if current_user.is_authenticated:
-        user_fee = getattr(current_user, 'management_fee_percentage', 30.0)
-        if user_fee is not None:
-            fee_rate = user_fee
-            
-    management_fee = gross_profit * (fee_rate / 100.0)
-    monthly_income = gross_profit - management_fee
-
-    if room_type and room_type != 'All':
-        room_count = 1
-    else:
-        if current_user.is_authenticated and current_user.role == 'owner':
-            room_count = len(current_user.allowed_units or [])
-        else:
-            room_count = db.session.query(func.count(func.distinct(Booking.unit_name))).scalar()
-    
-    room_count = room_count or 1
-
-    days_in_period = calendar.monthrange(year, month)[1] if month else 365
-    total_possible_nights = room_count * days_in_period
-    total_nights_booked = sum(clean_nan(b.duration, 0) for b in bookings)
-    total_occupancy_rate = (total_nights_booked / total_possible_nights) * 100 if total_possible_nights > 0 else 0
-    
-    revpar = total_booking_revenue / total_possible_nights if total_possible_nights > 0 else 0
-
-    summary = {
-        'total_booking_revenue': total_booking_revenue, 'total_monthly_expenses': total_monthly_expenses,
-        'gross_profit': gross_profit, 'management_fee': management_fee, 'fee_rate': fee_rate,
-        'monthly_income': monthly_income, 'total_occupancy_rate': total_occupancy_rate,
-        'revpar': revpar
-    }
-    return summary, {}
-
 @main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -127,20 +70,15 @@ def index():
     try:
         selected_year = request.args.get('year', datetime.now().year, type=int)
         
-        years_query = db.session.query(extract('year', Booking.checkin)).distinct()
-        if current_user.role == 'owner':
-            years_query = years_query.filter(Booking.unit_name.in_(current_user.allowed_units or []))
-        years_options = [y[0] for y in years_query.order_by(extract('year', Booking.checkin).desc()).all() if y[0]]
+        options = filter_options()
+        years_options = list(options['years'])
         
         if not years_options: years_options = [datetime.now().year]
         if selected_year not in years_options: selected_year = years_options[0]
         
         months_options = [{'value': i, 'text': calendar.month_name[i]} for i in range(1, 13)]
         
-        if current_user.role == 'admin':
-            room_types = ['All'] + [r[0] for r in db.session.query(Booking.unit_name).distinct().order_by(Booking.unit_name).all() if r[0]]
-        else:
-            room_types = ['All'] + (current_user.allowed_units or [])
+        room_types = ['All'] + options['units']
             
         return render_template('index.html', title='Dashboard', years_options=years_options, months_options=months_options, room_types=room_types, default_year=str(selected_year), current_user_role=current_user.role)
     except Exception as e:
@@ -156,133 +94,365 @@ def download_monthly_statement():
             flash('请选择一个月份来生成月结单。', 'warning')
             return redirect(url_for('main.index'))
         room_type = request.args.get('room_type', 'All')
-        bookings, expenses = get_filtered_data(year, month, room_type)
-        summary, _ = calculate_dashboard_data(bookings, expenses, year, month, room_type)
-        generation_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        rendered_html = render_template('pdf_template.html', year=year, month=calendar.month_name[month], room_type=room_type, summary=summary, bookings=bookings, expenses=expenses, generation_time=generation_time)
-        pdf = pdfkit.from_string(rendered_html, False)
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=monthly_statement_{year}_{month}.pdf'
-        return response
+        return send_file(cached_statement(year, month, room_type), mimetype='application/pdf', as_attachment=True,
+                         download_name=f'monthly_statement_{year}_{month}.pdf', conditional=True)
     except Exception as e:
         current_app.logger.error(f"Error generating PDF: {e}"); return "Error generating PDF.", 500
 
+def statement_job_status(job):
+    status = {
+        'job_id': job.id, 'batch_id': job.batch_id, 'user_id': job.user_id, 'status': job.status,
+        'year': job.year, 'month': job.month, 'room_type': job.room_type, 'error': job.error
+    }
+    if job.status == 'done':
+        status['download_url'] = url_for('main.download_statement_job', job_id=job.id)
+    return status
+
+def get_statement_job(job_id):
+    """Returns the job if the current user may see it (their own, or any job for an admin)."""
+    job = db.session.get(StatementJob, job_id)
+    if job is None or (current_user.role != 'admin' and job.user_id != current_user.id):
+        return None
+    return job
+
+@main.route('/api/statements', methods=['POST'])
+@login_required
+def create_statement_job():
+    """Queues the current user's monthly statement and returns the job to poll."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        year = int(data.get('year') or datetime.now().year)
+        month = int(data.get('month') or 0)
+    except (TypeError, ValueError):
+        month = 0
+    if not 1 <= month <= 12:
+        return jsonify({'success': False, 'message': '请选择一个月份来生成月结单。'}), 400
+    job, = statement_queue.enqueue([current_user.id], year, month, data.get('room_type') or 'All')
+    return jsonify(statement_job_status(job)), 202
+
+@main.route('/api/statements/month_end', methods=['POST'])
+@login_required
+def create_month_end_statements():
+    """Queues every owner's statement for a month as one batch."""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    data = request.get_json(silent=True) or request.form
+    try:
+        year, month = int(data.get('year')), int(data.get('month'))
+    except (TypeError, ValueError):
+        month = 0
+    if not 1 <= month <= 12:
+        return jsonify({'success': False, 'message': '请提供年份和月份。'}), 400
+    owners = [u.id for u in User.query.filter_by(role='owner').order_by(User.id)]
+    batch_id = str(uuid.uuid4())
+    jobs = statement_queue.enqueue(owners, year, month, batch_id=batch_id)
+    return jsonify({'batch_id': batch_id, 'jobs': [statement_job_status(j) for j in jobs]}), 202
+
+@main.route('/api/statements/batch/<batch_id>')
+@login_required
+def statement_batch_status(batch_id):
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    jobs = StatementJob.query.filter_by(batch_id=batch_id).order_by(StatementJob.user_id).all()
+    if not jobs:
+        return jsonify({'success': False, 'message': '任务未找到'}), 404
+    counts = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return jsonify({'batch_id': batch_id, 'counts': counts, 'jobs': [statement_job_status(j) for j in jobs]})
+
+@main.route('/api/statements/<job_id>')
+@login_required
+def statement_job(job_id):
+    job = get_statement_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务未找到'}), 404
+    if job.status in ('queued', 'running') and statement_queue.fail_stale_jobs(job.id):
+        db.session.refresh(job)
+    return jsonify(statement_job_status(job))
+
+@main.route('/api/statements/<job_id>/download')
+@login_required
+def download_statement_job(job_id):
+    job = get_statement_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务未找到'}), 404
+    if job.status != 'done' or not job.file_path:
+        return jsonify(statement_job_status(job)), 409
+    if not os.path.exists(job.file_path):
+        return jsonify({'success': False, 'message': '文件已从缓存中清除，请重新生成月结单。'}), 410
+    return send_file(job.file_path, mimetype='application/pdf', as_attachment=True,
+                     download_name=f'monthly_statement_{job.year}_{job.month}.pdf', conditional=True)
+
+def summary_payload(summary, analysis):
+    return {'summary': {k: clean_nan(v) for k, v in summary.items()}, 'analysis': {k: clean_nan(v) for k, v in analysis.items()}}
+
+def chart_payload(series, year, compare_year):
+    main_series = series[year]
+    response = {
+        'months': calendar.month_name[1:],
+        'main_year': {'year': year, 'revenue': main_series['revenue'], 'expenses': main_series['expenses'], 'cleaning_fees': main_series['cleaning_fees']}
+    }
+    if compare_year:
+        response['compare_year'] = {'year': compare_year, 'revenue': series[compare_year]['revenue']}
+    return response
+
+def channel_payload(channel_revenue):
+    return {'labels': [item[0] or "Unknown" for item in channel_revenue], 'values': [clean_nan(item[1]) for item in channel_revenue]}
+
 @main.route('/api/filter_data')
 @login_required
+@cached_response('filter_data')
 def api_filter_data():
     try:
         year = request.args.get('year', datetime.now().year, type=int)
         month_str = request.args.get('month', ''); month = int(month_str) if month_str.isdigit() else None
         room_type = request.args.get('room_type', 'All')
-        bookings, expenses = get_filtered_data(year, month, room_type)
-        summary, analysis = calculate_dashboard_data(bookings, expenses, year, month, room_type)
-        return jsonify({'summary': {k: clean_nan(v) for k, v in summary.items()}, 'analysis': {k: clean_nan(v) for k, v in analysis.items()}})
+        return jsonify(summary_payload(*calculate_dashboard_data(year, month, room_type)))
     except Exception as e:
         current_app.logger.error(f"Error in /api/filter_data: {e}"); return jsonify({"error": "Internal server error"}), 500
 
 @main.route('/api/chart_data')
 @login_required
+@cached_response('chart_data')
 def api_chart_data():
     try:
         year = request.args.get('year', datetime.now().year, type=int)
         compare_year_str = request.args.get('compare_year', '')
         compare_year = int(compare_year_str) if compare_year_str.isdigit() else None
         room_type = request.args.get('room_type', 'All')
-
-        def get_monthly_data(target_year):
-            revenue, expenses, cleaning_fees = [], [], []
-            for month in range(1, 13):
-                bookings, expense_items = get_filtered_data(target_year, month, room_type)
-                revenue.append(sum(clean_nan(b.total) for b in bookings))
-                expenses.append(sum(clean_nan(e.debit) for e in expense_items))
-                cleaning_fees.append(sum(clean_nan(b.cleaning_fee) for b in bookings))
-            return revenue, expenses, cleaning_fees
-
-        main_revenue, main_expenses, main_cleaning_fees = get_monthly_data(year)
-        
-        response = {
-            'months': calendar.month_name[1:],
-            'main_year': {'year': year, 'revenue': main_revenue, 'expenses': main_expenses, 'cleaning_fees': main_cleaning_fees}
-        }
-
-        if compare_year:
-            compare_revenue, _, _ = get_monthly_data(compare_year)
-            response['compare_year'] = {'year': compare_year, 'revenue': compare_revenue}
-            
-        return jsonify(response)
+        return jsonify(chart_payload(monthly_totals([year, compare_year], room_type), year, compare_year))
     except Exception as e:
         current_app.logger.error(f"Error in /api/chart_data: {e}"); return jsonify({"error": "Internal server error"}), 500
 
 @main.route('/api/revenue_by_channel')
 @login_required
+@cached_response('revenue_by_channel')
 def api_revenue_by_channel():
     try:
         year = request.args.get('year', datetime.now().year, type=int)
         room_type = request.args.get('room_type', 'All')
-
-        query = db.session.query(
-            Booking.channel,
-            func.sum(Booking.total)
-        ).filter(extract('year', Booking.checkin) == year)
-        
-        if current_user.role == 'owner':
-            query = query.filter(Booking.unit_name.in_(current_user.allowed_units or []))
-        
-        if room_type and room_type != 'All':
-            query = query.filter(Booking.unit_name == room_type)
-            
-        channel_revenue = query.group_by(Booking.channel).order_by(func.sum(Booking.total).desc()).all()
-
-        labels = [item[0] or "Unknown" for item in channel_revenue]
-        values = [clean_nan(item[1]) for item in channel_revenue]
-        
-        return jsonify({'labels': labels, 'values': values})
+        return jsonify(channel_payload(revenue_by_channel(year, room_type)))
     except Exception as e:
         current_app.logger.error(f"Error in /api/revenue_by_channel: {e}"); return jsonify({"error": "Internal server error"}), 500
 
-@main.route('/api/detailed_data')
+@main.route('/api/meta')
 @login_required
-def api_detailed_data():
+@cached_response('meta')
+def api_meta():
+    """Years, units and channels for the current user's filter dropdowns."""
+    try:
+        return jsonify(filter_options())
+    except Exception as e:
+        current_app.logger.error(f"Error in /api/meta: {e}"); return jsonify({"error": "Internal server error"}), 500
+
+@main.route('/api/dashboard')
+@login_required
+@cached_response('dashboard')
+def api_dashboard():
+    """The summary cards, comparison chart and channel chart of index.html in one response."""
     try:
         year = request.args.get('year', datetime.now().year, type=int)
         month_str = request.args.get('month', ''); month = int(month_str) if month_str.isdigit() else None
+        compare_year_str = request.args.get('compare_year', '')
+        compare_year = int(compare_year_str) if compare_year_str.isdigit() else None
         room_type = request.args.get('room_type', 'All')
-        bookings, expenses = get_filtered_data(year, month, room_type)
-        
-        data = []
-        for b in bookings:
-            booking_data = {
-                'type': 'booking', 'id': b.id, 'date': b.checkin.strftime('%Y-%m-%d'),
-                'unit_name': b.unit_name,
-                'checkin': b.checkin.strftime('%Y-%m-%d'), 'checkout': b.checkout.strftime('%Y-%m-%d'),
-                'channel': b.channel, 'on_offline': b.on_offline, 'pax': b.pax, 'duration': b.duration,
-                'price': clean_nan(b.price), 'cleaning_fee': clean_nan(b.cleaning_fee), 
-                'platform_charge': clean_nan(b.platform_charge), 'total_booking_revenue': clean_nan(b.total), 
-                'booking_number': str(b.booking_number) if b.booking_number else '-',
-                'additional_expense_category': '-', 
-                'additional_expense_amount': 0
-            }
-            data.append(booking_data)
-
-        for e in expenses:
-            expense_data = {
-                'type': 'expense', 'id': e.id, 'date': e.date.strftime('%Y-%m-%d'),
-                'unit_name': e.unit_name or '_GENERAL_EXPENSE_',
-                'checkin': '-', 'checkout': '-', 'channel': '-', 'on_offline': '-', 'pax': '-', 'duration': '-',
-                'price': 0, 'cleaning_fee': 0, 'platform_charge': 0, 'total_booking_revenue': 0,
-                'booking_number': '-',
-                'additional_expense_category': e.particulars, 
-                'additional_expense_amount': clean_nan(e.debit)
-            }
-            data.append(expense_data)
-
-        data.sort(key=lambda x: x['date']); 
-        return jsonify({'data': data})
+        summary, series, channels = dashboard_data(year, month, compare_year, room_type)
+        return jsonify({**summary_payload(summary, {}), 'chart': chart_payload(series, year, compare_year),
+                        'channels': channel_payload(channels)})
+    except Exception as e:
+        current_app.logger.error(f"Error in /api/dashboard: {e}"); return jsonify({"error": "Internal server error"}), 500
+
+def summary_rows(report_type, year, room_type):
+    """Rows of the annual report (one, with its year) or the quarterly report (Q1-Q4, labelled under '季度')."""
+    if report_type == 'annual':
+        return [{'year': year, **period_summaries([year], room_type)[(year, None)]}]
+    summaries = period_summaries([year], room_type, by_quarter=True)
+    return [{'季度': f'Q{quarter}', 'year': year, **summaries[(year, quarter)]} for quarter in (1, 2, 3, 4)]
+
+@main.route('/api/annual_summary')
+@login_required
+@cached_response('annual_summary')
+def api_annual_summary():
+    try:
+        year = request.args.get('year', datetime.now().year, type=int)
+        room_type = request.args.get('room_type', 'All')
+        return jsonify(summary_rows('annual', year, room_type)[0])
+    except Exception as e:
+        current_app.logger.error(f"Error in /api/annual_summary: {e}"); return jsonify({"error": "Internal server error"}), 500
+
+@main.route('/api/quarterly_summary')
+@login_required
+@cached_response('quarterly_summary')
+def api_quarterly_summary():
+    try:
+        year = request.args.get('year', datetime.now().year, type=int)
+        room_type = request.args.get('room_type', 'All')
+        quarters = {}
+        for row in summary_rows('quarterly', year, room_type):
+            quarters[row.pop('季度')] = row
+        return jsonify(quarters)
+    except Exception as e:
+        current_app.logger.error(f"Error in /api/quarterly_summary: {e}"); return jsonify({"error": "Internal server error"}), 500
+
+def detailed_record(r):
+    """Serialises a row of detailed_records_query for the detailed records table."""
+    if r.type == 'booking':
+        return {
+            'type': 'booking', 'id': r.id, 'date': r.date.strftime('%Y-%m-%d'),
+            'unit_name': r.unit_name,
+            'checkin': r.checkin.strftime('%Y-%m-%d'), 'checkout': r.checkout.strftime('%Y-%m-%d'),
+            'channel': r.channel, 'on_offline': r.on_offline, 'pax': r.pax, 'duration': r.duration,
+            'price': clean_nan(r.price), 'cleaning_fee': clean_nan(r.cleaning_fee), 
+            'platform_charge': clean_nan(r.platform_charge), 'total_booking_revenue': clean_nan(r.total), 
+            'booking_number': str(r.booking_number) if r.booking_number else '-',
+            'additional_expense_category': '-', 
+            'additional_expense_amount': 0
+        }
+    return {
+        'type': 'expense', 'id': r.id, 'date': r.date.strftime('%Y-%m-%d'),
+        'unit_name': r.unit_name or '_GENERAL_EXPENSE_',
+        'checkin': '-', 'checkout': '-', 'channel': '-', 'on_offline': '-', 'pax': '-', 'duration': '-',
+        'price': 0, 'cleaning_fee': 0, 'platform_charge': 0, 'total_booking_revenue': 0,
+        'booking_number': '-',
+        'additional_expense_category': r.particulars, 
+        'additional_expense_amount': clean_nan(r.debit)
+    }
+
+def record_filters():
+    year = request.args.get('year', datetime.now().year, type=int)
+    month_str = request.args.get('month', ''); month = int(month_str) if month_str.isdigit() else None
+    room_type = request.args.get('room_type', 'All')
+    return year, month, room_type
+
+@main.route('/api/detailed_data')
+@login_required
+@cached_response('detailed_data')
+def api_detailed_data():
+    """
+    Returns the detailed records ordered by (date, id). Without limit/cursor every record comes
+    back at once; with them, one page plus the next_cursor to pass back for the following page.
+    """
+    try:
+        year, month, room_type = record_filters()
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        if limit is None and not cursor:
+            records = db.session.execute(detailed_records_query(year, month, room_type))
+            return jsonify({'data': [detailed_record(r) for r in records]})
+
+        try:
+            position = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        limit = max(1, min(limit or DETAILED_PAGE_SIZE, DETAILED_PAGE_MAX))
+        records = db.session.execute(detailed_records_query(year, month, room_type, position).limit(limit + 1)).all()
+        page = records[:limit]
+        next_cursor = encode_cursor(page[-1]) if len(records) > limit else None
+        return jsonify({'data': [detailed_record(r) for r in page], 'next_cursor': next_cursor})
     except Exception as e:
         current_app.logger.error(f"Error in /api/detailed_data: {e}"); 
         return jsonify({"error": "Internal server error"}), 500
 
+@main.route('/api/detailed_data/stream')
+@login_required
+def api_detailed_data_stream():
+    """Streams the detailed records as NDJSON, one object per line, from a server-side cursor."""
+    year, month, room_type = record_filters()
+    query = detailed_records_query(year, month, room_type).execution_options(yield_per=DETAILED_STREAM_BATCH)
+
+    def generate():
+        try:
+            for r in db.session.execute(query):
+                yield json.dumps(detailed_record(r)) + '\n'
+        except Exception as e:
+            current_app.logger.error(f"Error in /api/detailed_data/stream: {e}")
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@main.route('/api/export/<fmt>')
+@login_required
+def api_export(fmt):
+    """
+    Downloads a report as CSV or XLSX with the same filters and owner restrictions as the
+    report APIs. Detailed rows are read from a server-side cursor; CSV is streamed chunk by
+    chunk and XLSX is written row by row to a temporary file.
+    """
+    if fmt not in ('csv', 'xlsx'):
+        return jsonify({"error": f"Unsupported export format: {fmt}"}), 404
+    report_type = request.args.get('report_type', 'detailed')
+    if report_type not in ('detailed', 'annual', 'quarterly'):
+        return jsonify({"error": f"Unsupported report type: {report_type}"}), 400
+    try:
+        year, month, room_type = record_filters()
+        if report_type == 'detailed':
+            headers = DETAILED_COLUMNS
+            query = detailed_records_query(year, month, room_type).execution_options(yield_per=DETAILED_STREAM_BATCH)
+            filename = f"detailed_report_{year}_{month}" if month else f"detailed_report_{year}"
+
+            def rows():
+                for r in db.session.execute(query):
+                    yield detailed_record(r)
+        else:
+            headers = ANNUAL_COLUMNS if report_type == 'annual' else QUARTERLY_COLUMNS
+            summaries = summary_rows(report_type, year, room_type)
+            filename = f"{report_type}_report_{year}"
+
+            def rows():
+                return iter(summaries)
+
+        columns = select_columns(request.args.get('columns'), headers)
+        if fmt == 'csv':
+            response = Response(stream_with_context(iter_csv(rows(), columns, headers)), mimetype='text/csv')
+            response.headers['Content-Disposition'] = f'attachment; filename={filename}.csv'
+            return response
+        output = write_xlsx(rows(), columns, headers, title=report_type.capitalize())
+        return send_file(output, as_attachment=True, download_name=f'{filename}.xlsx',
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    except Exception as e:
+        current_app.logger.error(f"Error in /api/export: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@main.route('/api/calendar_events')
+@login_required
+@cached_response('calendar_events')
+def api_calendar_events():
+    """
+    Returns the FullCalendar events for the bookings overlapping the requested start/end window,
+    falling back to the year/month filter when FullCalendar does not send one.
+    """
+    try:
+        year, month, room_type = record_filters()
+        try:
+            if request.args.get('start') and request.args.get('end'):
+                # FullCalendar sends ISO timestamps; only the date part matters for whole-day stays.
+                start = date.fromisoformat(request.args['start'][:10])
+                end = date.fromisoformat(request.args['end'][:10])
+            else:
+                start, end = period_bounds(year, month)
+        except ValueError:
+            return jsonify({"error": "Invalid start or end date"}), 400
+
+        bookings = db.session.query(
+            Booking.id, Booking.unit_name, Booking.checkin, Booking.checkout,
+            Booking.booking_number, Booking.channel, Booking.pax
+        ).filter(booking_overlap(start, end), unit_scope(Booking, room_type)).order_by(Booking.checkin, Booking.id)
+
+        events = [{
+            'id': b.id, 'title': b.unit_name, 'start': b.checkin.isoformat(), 'end': b.checkout.isoformat(),
+            'extendedProps': {'bookingNumber': b.booking_number, 'channel': b.channel, 'pax': b.pax}
+        } for b in bookings]
+        return jsonify(events)
+    except Exception as e:
+        current_app.logger.error(f"Error in /api/calendar_events: {e}"); return jsonify({"error": "Internal server error"}), 500
+
+@main.route('/api/cache_stats')
+@login_required
+def api_cache_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    return jsonify(response_cache.stats())
 
 @main.route('/admin')
 @login_required
@@ -292,9 +462,50 @@ def admin():
         return redirect(url_for('main.index'))
     
     users = User.query.order_by(User.id).all()
-    all_units = sorted([r[0] for r in db.session.query(Booking.unit_name).distinct().all() if r[0]])
+    units = Unit.query.order_by(Unit.name).all()
+    all_units = [unit.name for unit in units]
+    owner_counts = dict(db.session.query(user_unit.c.unit_id, db.func.count()).group_by(user_unit.c.unit_id).all())
     
-    return render_template('admin.html', title='管理面板', users=users, all_units=all_units)
+    return render_template('admin.html', title='管理面板', users=users, all_units=all_units, units=units, owner_counts=owner_counts)
+
+@main.route('/admin/units', methods=['POST'])
+@login_required
+def add_unit():
+    if current_user.role != 'admin':
+        flash('您没有权限执行此操作。', 'danger')
+        return redirect(url_for('main.index'))
+
+    name = (request.form.get('name') or '').strip()
+    if not name:
+        flash('房源名称不能为空。', 'warning')
+    elif Unit.query.filter_by(name=name).first():
+        flash(f'房源 {name} 已存在。', 'warning')
+    else:
+        db.session.add(Unit(name=name))
+        bump_data_version()
+        db.session.commit()
+        flash(f'房源 {name} 已添加。', 'success')
+    return redirect(url_for('main.admin'))
+
+@main.route('/admin/units/<int:unit_id>/delete', methods=['POST'])
+@login_required
+def delete_unit(unit_id):
+    if current_user.role != 'admin':
+        flash('您没有权限执行此操作。', 'danger')
+        return redirect(url_for('main.index'))
+
+    unit = Unit.query.get_or_404(unit_id)
+    if Booking.query.filter_by(unit_id=unit.id).first() or Expense.query.filter_by(unit_id=unit.id).first():
+        flash(f'房源 {unit.name} 仍有预订或支出记录，无法删除。', 'warning')
+        return redirect(url_for('main.admin'))
+    owners = [user.id for user in unit.users]
+    db.session.delete(unit)
+    bump_data_version()
+    db.session.commit()
+    for owner_id in owners:
+        principal_cache.invalidate(owner_id)
+    flash(f'房源 {unit.name} 已删除，并已从 {len(owners)} 位业主的授权中移除。', 'success')
+    return redirect(url_for('main.admin'))
 
 @main.route('/api/update_user_permissions', methods=['POST'])
 @login_required
@@ -310,6 +521,7 @@ def update_user_permissions():
 
     if 'allowed_units' in data:
         user.allowed_units = data.get('allowed_units', [])
+        bump_data_version()  # may have registered new units
     
     if 'management_fee_percentage' in data:
         try:
@@ -322,6 +534,7 @@ def update_user_permissions():
             return jsonify({'success': False, 'message': '无效的管理费率格式'}), 400
             
     db.session.commit()
+    principal_cache.invalidate(user.id)
     
     return jsonify({'success': True, 'message': '用户资料已更新'})
 
@@ -350,6 +563,7 @@ def reset_password(token):
     if form.validate_on_submit():
         user.set_password(form.password.data)
         db.session.commit()
+        principal_cache.invalidate(user.id)
         flash('您的密码已成功重置！现在可以登录了。', 'success')
         return redirect(url_for('main.login'))
         
@@ -360,12 +574,15 @@ def reset_password(token):
 def change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if not current_user.check_password(form.current_password.data):
+        # current_user is a cached principal; the password lives on the User row
+        user = db.session.get(User, current_user.id)
+        if not user.check_password(form.current_password.data):
             flash('当前密码不正确，请重试。', 'danger')
             return redirect(url_for('main.change_password'))
         
-        current_user.set_password(form.new_password.data)
+        user.set_password(form.new_password.data)
         db.session.commit()
+        principal_cache.invalidate(user.id)
         flash('您的密码已成功修改！', 'success')
         return redirect(url_for('main.index'))
         
@@ -386,6 +603,7 @@ def delete_user(user_id):
         
     db.session.delete(user_to_delete)
     db.session.commit()
+    principal_cache.invalidate(user_to_delete.id)
     flash(f'用户 {user_to_delete.id} 已被成功删除。', 'success')
     return redirect(url_for('main.admin'))
 
@@ -395,12 +613,16 @@ def edit_booking(booking_id):
     booking = Booking.query.get_or_404(booking_id)
     form = BookingForm(obj=booking)
     if current_user.role == 'admin':
-        form.unit_name.choices = [r[0] for r in db.session.query(Booking.unit_name).distinct().order_by(Booking.unit_name).all() if r[0]]
+        form.unit_name.choices = filter_options()['units']
     else:
         form.unit_name.choices = current_user.allowed_units or []
     
     if form.validate_on_submit():
+        old_keys = booking_rollup_keys(booking)
         form.populate_obj(booking)
+        keys = old_keys + booking_rollup_keys(booking)
+        refresh_rollups(*keys)
+        bump_data_version(*keys)
         db.session.commit()
         flash('预订信息已更新！', 'success')
         return redirect(url_for('main.index'))
@@ -411,6 +633,9 @@ def edit_booking(booking_id):
 def delete_booking(booking_id):
     booking = Booking.query.get_or_404(booking_id)
     db.session.delete(booking)
+    keys = booking_rollup_keys(booking)
+    refresh_rollups(*keys)
+    bump_data_version(*keys)
     db.session.commit()
     flash('预订信息已删除！', 'success')
     return redirect(url_for('main.index'))
@@ -421,12 +646,15 @@ def edit_expense(expense_id):
     expense = Expense.query.get_or_404(expense_id)
     form = ExpenseForm(obj=expense)
     if current_user.role == 'admin':
-        form.unit_name.choices = [r[0] for r in db.session.query(Booking.unit_name).distinct().order_by(Booking.unit_name).all() if r[0]]
+        form.unit_name.choices = filter_options()['units']
     else:
         form.unit_name.choices = current_user.allowed_units or []
         
     if form.validate_on_submit():
+        old_key = expense_rollup_key(expense)
         form.populate_obj(expense)
+        refresh_rollups(old_key, expense_rollup_key(expense))
+        bump_data_version(old_key, expense_rollup_key(expense))
         db.session.commit()
         flash('费用信息已更新！', 'success')
         return redirect(url_for('main.index'))
@@ -437,6 +665,8 @@ def edit_expense(expense_id):
 def delete_expense(expense_id):
     expense = Expense.query.get_or_404(expense_id)
     db.session.delete(expense)
+    refresh_rollups(expense_rollup_key(expense))
+    bump_data_version(expense_rollup_key(expense))
     db.session.commit()
     flash('费用信息已删除！', 'success')
     return redirect(url_for('main.index'))
@@ -449,6 +679,9 @@ def add_booking():
         new_booking = Booking()
         form.populate_obj(new_booking)
         db.session.add(new_booking)
+        keys = booking_rollup_keys(new_booking)
+        refresh_rollups(*keys)
+        bump_data_version(*keys)
         db.session.commit()
         flash('新预订已添加！', 'success')
         return redirect(url_for('main.index'))
@@ -462,6 +695,8 @@ def add_expense():
         new_expense = Expense()
         form.populate_obj(new_expense)
         db.session.add(new_expense)
+        refresh_rollups(expense_rollup_key(new_expense))
+        bump_data_version(expense_rollup_key(new_expense))
         db.session.commit()
         flash('新费用已添加！', 'success')
         return redirect(url_for('main.index'))
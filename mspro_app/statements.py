@@ -0,0 +1,164 @@
+from flask import current_app
+from flask_login import login_user, current_user
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+import calendar
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from .extensions import db
+from .models import User, StatementJob
+from .filters import build_filtered_queries
+from .aggregation import calculate_dashboard_data, management_fee_rate, room_count
+from .cache import get_period_version
+from .renderers import get_renderer
+
+def statement_pdf(year, month, room_type='All', renderer=None):
+    """Renders the current user's monthly statement for a period and returns the PDF bytes."""
+    bookings_query, expenses_query = build_filtered_queries(year, month, room_type)
+    summary, _ = calculate_dashboard_data(year, month, room_type)
+    context = dict(year=year, month=calendar.month_name[month], room_type=room_type, summary=summary,
+                   bookings=bookings_query.all(), expenses=expenses_query.all(),
+                   generation_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return get_renderer(renderer).render(context)
+
+class StatementCache:
+    """
+    Content-addressed store of rendered statement PDFs, shared by all workers through the
+    filesystem. Reads refresh a file's access time (its mtime, and so the ETag send_file derives,
+    stays put); once the directory outgrows max_bytes the least recently used files are removed.
+    """
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 512 * 1024 * 1024
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config['STATEMENT_DIR']
+        self.max_bytes = app.config.get('STATEMENT_CACHE_MAX_BYTES', self.max_bytes)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, pdf):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        partial = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(partial, 'wb') as f:
+            f.write(pdf)
+        os.replace(partial, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        with self._lock:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.pdf')]
+            entries = [(e.stat().st_atime, e.stat().st_size, e.path) for e in entries]
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+statement_cache = StatementCache()
+
+def statement_cache_key(year, month, room_type='All'):
+    """
+    Everything a statement's content depends on: the period, the viewer's scope and fee, the month's
+    data version, the renderer, and the room count behind occupancy (for the admin 'All' view it
+    counts every unit ever booked, which other months' data can change).
+    """
+    scope = sorted(current_user.allowed_units or []) if current_user.role == 'owner' else current_user.role
+    parts = [year, month, room_type, scope, management_fee_rate(), get_period_version(year, month), get_renderer().name,
+             room_count(room_type)]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+def cached_statement(year, month, room_type='All'):
+    """Returns the path of the current user's statement PDF, rendering it only on a cache miss."""
+    key = statement_cache_key(year, month, room_type)
+    return statement_cache.get(key) or statement_cache.put(key, statement_pdf(year, month, room_type))
+
+def run_statement_job(app, job_id):
+    """Renders one queued statement as the job's user. Runs on the statement worker threads."""
+    with app.test_request_context():
+        job = db.session.get(StatementJob, job_id)
+        if job is None or job.status != 'queued':  # e.g. failed as stale before a worker got to it
+            return
+        try:
+            job.status = 'running'
+            db.session.commit()
+            # Scoping and the fee rate follow current_user, so the job runs logged in as its user.
+            login_user(db.session.get(User, job.user_id))
+            job.file_path = cached_statement(job.year, job.month, job.room_type)
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error generating statement {job_id}: {e}")
+            job = db.session.get(StatementJob, job_id)
+            job.status, job.error = 'failed', str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+class StatementQueue:
+    """
+    Runs statement jobs on a thread pool inside each worker, so wkhtmltopdf never runs on the
+    request path. Job state lives in the statement_job table, so any worker can report it.
+    Jobs still queued or running after job_timeout seconds belonged to a worker that was
+    restarted; they are failed when a worker starts and when they are polled.
+    """
+    def __init__(self):
+        self.executor = None
+        self.job_timeout = 1800
+
+    def init_app(self, app):
+        self.executor = ThreadPoolExecutor(max_workers=app.config.get('STATEMENT_WORKERS', 2),
+                                           thread_name_prefix='statement')
+        self.job_timeout = app.config.get('STATEMENT_JOB_TIMEOUT', self.job_timeout)
+        with app.app_context():
+            try:
+                self.fail_stale_jobs()
+            except SQLAlchemyError:
+                # The statement_job table does not exist yet, e.g. before `flask db upgrade`.
+                db.session.rollback()
+
+    def fail_stale_jobs(self, job_id=None):
+        """Marks queued/running jobs older than job_timeout (or just job_id) as failed. Returns how many."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.job_timeout)
+        query = StatementJob.query.filter(StatementJob.status.in_(('queued', 'running')), StatementJob.created_at < cutoff)
+        if job_id is not None:
+            query = query.filter(StatementJob.id == job_id)
+        failed = query.update({StatementJob.status: 'failed', StatementJob.error: 'Statement job timed out',
+                               StatementJob.finished_at: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        return failed
+
+    def enqueue(self, user_ids, year, month, room_type='All', batch_id=None):
+        """Creates and commits one job per user, then hands them to the pool. Returns the jobs."""
+        jobs = [StatementJob(id=str(uuid.uuid4()), user_id=user_id, year=year, month=month,
+                             room_type=room_type, batch_id=batch_id, status='queued') for user_id in user_ids]
+        db.session.add_all(jobs)
+        db.session.commit()
+        app = current_app._get_current_object()
+        for job in jobs:
+            self.executor.submit(run_statement_job, app, job.id)
+        return jobs
+
+statement_queue = StatementQueue()
@@ -0,0 +1,117 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+from .importer import load_workbook, BOOKING_NATURAL_KEY
+from .models import MAX_STAY_NIGHTS
+
+# The standard range for a 32-bit signed integer in most databases
+INT32_MIN, INT32_MAX = -2147483648, 2147483647
+INTEGER_COLUMNS = {'booking': ['pax', 'duration'], 'expense': []}
+NUMERIC_COLUMNS = {'booking': ['pax', 'duration', 'price', 'cleaning_fee', 'platform_charge', 'total'], 'expense': ['debit']}
+DATE_COLUMNS = {'booking': ['checkin', 'checkout'], 'expense': ['date']}
+PERIOD_COLUMN = {'booking': 'checkin', 'expense': 'date'}
+# Checks that would make the import fail or load wrong values; the rest are reported as warnings.
+ERROR_CHECKS = {'int32_overflow', 'stay_too_long'}
+
+def file_year(path):
+    """Returns the year from a workbook name like '03_2023 expenses.xlsx', or None."""
+    match = re.match(r'\d{1,2}_(\d{4})\b', os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+def _issues(frame, mask, column, check, values=None):
+    rows = np.flatnonzero(mask)
+    values = frame[column] if values is None else values
+    return [{
+        'file': frame['source_file'].iat[i], 'row': int(frame.index[i]) + 2,  # header is Excel row 1
+        'column': column, 'check': check, 'severity': 'error' if check in ERROR_CHECKS else 'warning',
+        'value': None if pd.isna(values.iat[i]) else str(values.iat[i])
+    } for i in rows]
+
+def _repeated_booking_keys(frame, checkin, seen_keys):
+    """
+    Flags rows whose booking number, unit and check-in repeat an earlier row of the workbook
+    or of a workbook scanned before (seen_keys, updated in place). Both rows are imported.
+    """
+    if not all(c in frame.columns for c in BOOKING_NATURAL_KEY[:2]):
+        return np.zeros(len(frame), dtype=bool)
+    numbers = frame['booking_number'].astype(str).str.strip()
+    present = (frame['booking_number'].notna() & frame['unit_name'].notna() & checkin.notna() & (numbers != '')).to_numpy()
+    keys = pd.MultiIndex.from_arrays([numbers, frame['unit_name'].astype(str), checkin.dt.date])
+    repeated = present & (keys.duplicated() | keys.isin(list(seen_keys)))
+    seen_keys.update(keys[present])
+    return repeated
+
+def scan_frame(frame, kind, year=None, seen_keys=None):
+    """
+    Validates a workbook frame from load_workbook in one vectorised pass per column and
+    returns a list of issue dicts (file, row, column, check, severity, value). Pass the same
+    seen_keys set for every booking workbook to catch bookings repeated across files.
+    """
+    issues = []
+    numbers, dates = {}, {}
+    for col in NUMERIC_COLUMNS[kind]:
+        if col not in frame.columns:
+            continue
+        raw = frame[col]
+        numbers[col] = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=float)
+        issues += _issues(frame, raw.notna().to_numpy() & np.isnan(numbers[col]), col, 'not_numeric')
+    for col in INTEGER_COLUMNS[kind]:
+        if col in numbers:
+            values = numbers[col]
+            issues += _issues(frame, (values < INT32_MIN) | (values > INT32_MAX), col, 'int32_overflow')
+    for col in DATE_COLUMNS[kind]:
+        if col not in frame.columns:
+            continue
+        raw = frame[col]
+        dates[col] = pd.to_datetime(raw, errors='coerce')
+        issues += _issues(frame, raw.notna().to_numpy() & dates[col].isna().to_numpy(), col, 'unparseable_date')
+
+    if kind == 'booking' and 'checkin' in dates and 'checkout' in dates:
+        nights = (dates['checkout'] - dates['checkin']).dt.days.to_numpy(dtype=float)
+        issues += _issues(frame, nights < 0, 'checkout', 'checkout_before_checkin')
+        issues += _issues(frame, nights > MAX_STAY_NIGHTS, 'checkout', 'stay_too_long')
+        if 'duration' in numbers:
+            duration = numbers['duration']
+            mismatch = ~np.isnan(nights) & ~np.isnan(duration) & (nights >= 0) & (duration != nights)
+            issues += _issues(frame, mismatch, 'duration', 'duration_mismatch')
+    if kind == 'booking' and 'checkin' in dates:
+        seen_keys = set() if seen_keys is None else seen_keys
+        repeated = _repeated_booking_keys(frame, dates['checkin'], seen_keys)
+        issues += _issues(frame, repeated, 'booking_number', 'duplicate_booking_key')
+
+    period = PERIOD_COLUMN[kind]
+    if year is not None and period in dates:
+        years = dates[period].dt.year.to_numpy(dtype=float)
+        issues += _issues(frame, ~np.isnan(years) & (years != year), period, 'outside_file_year')
+    return issues
+
+def scan_workbooks(booking_files, expense_files, cache_dir=None):
+    """
+    Scans every workbook and returns a JSON-serialisable report:
+    {'files', 'rows', 'errors', 'warnings', 'counts': {check: n}, 'issues': [...]}.
+    """
+    report = {'files': 0, 'rows': 0, 'errors': 0, 'warnings': 0, 'counts': {}, 'issues': []}
+    booking_keys = set()
+    for kind, files in (('booking', booking_files), ('expense', expense_files)):
+        for path in files:
+            try:
+                frame = load_workbook(path, kind, cache_dir)
+            except Exception as e:
+                frame, issues = None, [{'file': os.path.basename(path), 'row': None, 'column': None,
+                                        'check': 'unreadable', 'severity': 'error', 'value': str(e)}]
+            else:
+                issues = scan_frame(frame, kind, file_year(path), booking_keys)
+            report['files'] += 1
+            report['rows'] += 0 if frame is None else len(frame)
+            for issue in issues:
+                issue['kind'] = kind
+                report['counts'][issue['check']] = report['counts'].get(issue['check'], 0) + 1
+                report['errors' if issue['severity'] == 'error' else 'warnings'] += 1
+            report['issues'] += issues
+    return report
+
+def format_issue(issue):
+    row = f"row {issue['row']}" if issue['row'] else 'file'
+    column = f" '{issue['column']}'" if issue['column'] else ''
+    return f"{issue['severity'].upper()}: {issue['file']} {row}{column}: {issue['check']} ({issue['value']})"
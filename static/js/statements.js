@@ -0,0 +1,23 @@
+// Statements are rendered by a background job; poll it and download the PDF when it is ready.
+const STATEMENT_POLL_INTERVAL_MS = 1000;
+const STATEMENT_MAX_WAIT_MS = 3 * 60 * 1000;
+
+async function downloadStatement(params, loadingOverlay) {
+    if (loadingOverlay) loadingOverlay.style.display = 'flex';
+    try {
+        let job = await fetch('/api/statements', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(params) }).then(res => res.json());
+        const deadline = Date.now() + STATEMENT_MAX_WAIT_MS;
+        while (job.status === 'queued' || job.status === 'running') {
+            if (Date.now() > deadline) throw new Error('Timed out waiting for the statement');
+            await new Promise(resolve => setTimeout(resolve, STATEMENT_POLL_INTERVAL_MS));
+            job = await fetch(`/api/statements/${job.job_id}`).then(res => res.json());
+        }
+        if (job.status !== 'done') throw new Error(job.error || job.message || 'PDF generation failed');
+        window.location.href = job.download_url;
+    } catch (error) {
+        console.error('Error generating PDF:', error);
+        alert('生成PDF失败，请稍后重试。');
+    } finally {
+        if (loadingOverlay) loadingOverlay.style.display = 'none';
+    }
+}
@@ -1,13 +1,12 @@
 from mspro_app import create_app, db
 import click
 from flask.cli import with_appcontext
-from mspro_app.models import User, Booking, Expense
-import pandas as pd
+from mspro_app.models import User, Booking, Expense, ImportedFile, StatementJob
+from mspro_app.rollups import rebuild_rollups, refresh_rollups, check_rollups
+from mspro_app.cache import bump_data_version
+from mspro_app.statements import statement_queue
 import os
-import glob
 import uuid
-import math
-from datetime import datetime
 
 app = create_app()
 
@@ -17,90 +16,94 @@ if os.environ.get("FLASK_ENV") == "production":
     app.wsgi_app = WhiteNoise(app.wsgi_app, root='static/', prefix='static/')
 
 @app.cli.command("import-data")
+@click.option('--incremental', is_flag=True, help='Only re-process new or changed workbooks and upsert their rows.')
+@click.option('--jobs', type=int, default=None, help='Number of worker processes used to parse workbooks (default: CPU count).')
+@click.option('--no-cache', is_flag=True, help='Always parse the Excel files instead of using the Parquet cache.')
+@click.option('--preflight', is_flag=True, help='Validate the workbooks first and abort the import if errors are found.')
 @with_appcontext
-def import_data_command():
-    """Clears existing booking and expense data, then robustly imports new data from excel files."""
+def import_data_command(incremental, jobs, no_cache, preflight):
+    """Imports booking and expense data from excel files, replacing it (default) or upserting changed workbooks (--incremental)."""
+    # pandas comes in with these, so only the import command pays for it, not every web worker
+    from mspro_app.validation import scan_workbooks, format_issue
+    from mspro_app.importer import (
+        list_booking_files, list_expense_files, import_workbooks, parquet_available, WORKBOOK_CACHE_DIR,
+        has_import_history, plan_incremental, stored_rollup_keys, remove_files, record_fingerprints, prune_workbook_cache
+    )
     print("--- Starting Data Import Command ---")
-    
-    # --- Step 1: Clear existing data without dropping tables ---
+
+    DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'excel_data')
+    jobs = jobs or os.cpu_count() or 1
+    cache_dir = None if no_cache else os.path.join(DATA_FOLDER, WORKBOOK_CACHE_DIR)
+    if cache_dir and not parquet_available():
+        print("INFO: pyarrow is not installed, parsed workbooks will not be cached.")
+    booking_files = list_booking_files(DATA_FOLDER)
+    expense_files = list_expense_files(DATA_FOLDER)
+
+    if incremental and not has_import_history():
+        print("INFO: No previous import fingerprints found, falling back to a full import.")
+        incremental = False
+
+    if preflight:
+        report = scan_workbooks(booking_files, expense_files, cache_dir)
+        for issue in report['issues']:
+            print(format_issue(issue))
+        print(f"Pre-flight: scanned {report['rows']} rows in {report['files']} files, "
+              f"{report['errors']} errors, {report['warnings']} warnings.")
+        if report['errors']:
+            print("Import aborted, no changes were made. Fix the errors above or run without --preflight.")
+            return
+
+    # Everything below runs in one transaction, so readers keep seeing the previous data
+    # until the commit and a failed import leaves the database untouched.
     try:
-        db.session.query(Booking).delete()
-        db.session.query(Expense).delete()
+        changed_any = not incremental
+        touched = set()  # rollup buckets of the rows an incremental import deletes or upserts
+        if incremental:
+            print(f"Step 1: Comparing workbooks in '{DATA_FOLDER}' with the last import...")
+        else:
+            # --- Step 1: Clear existing data without dropping tables ---
+            db.session.query(Booking).delete()
+            db.session.query(Expense).delete()
+            db.session.query(ImportedFile).delete()
+            print("Step 1: All existing booking and expense records will be replaced.")
+
+        print(f"Step 2: Reading data from '{DATA_FOLDER}'...")
+        for kind, model, files in (('booking', Booking, booking_files), ('expense', Expense, expense_files)):
+            if incremental:
+                changed, removed = plan_incremental(kind, files)
+                touched |= stored_rollup_keys(model, changed + removed)
+                if removed:
+                    print(f"Removed {remove_files(model, removed)} {kind} records from {len(removed)} deleted files.")
+                print(f"Found {len(files)} {kind} files, {len(changed)} new or changed.")
+                files = changed
+                changed_any = changed_any or bool(changed or removed)
+            else:
+                print(f"Found {len(files)} {kind} files.")
+            if files:
+                imported = import_workbooks(model, kind, files, jobs=jobs, incremental=incremental, cache_dir=cache_dir)
+                record_fingerprints(kind, files)
+                if incremental:
+                    touched |= stored_rollup_keys(model, files)
+                print(f"SUCCESS: {'Upserted' if incremental else 'Imported'} {imported} {kind} records.")
+
+        if incremental and changed_any:
+            refresh_rollups(*touched)
+            bump_data_version(*touched)
+            print(f"SUCCESS: Refreshed {len(touched)} monthly rollup buckets.")
+        elif changed_any:
+            unit_count, channel_count = rebuild_rollups()
+            bump_data_version(all_periods=True)
+            print(f"SUCCESS: Rebuilt {unit_count} monthly unit rollups and {channel_count} channel rollups.")
+        else:
+            print("INFO: No workbook changes since the last import.")
         db.session.commit()
-        print("Step 1: All existing booking and expense records have been deleted.")
     except Exception as e:
         db.session.rollback()
-        print(f"An error occurred while clearing data: {e}")
+        print(f"An error occurred during the import, no changes were made: {e}")
         return
-
-    DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'excel_data')
-    print(f"Step 2: Reading data from '{DATA_FOLDER}'...")
-
-    # --- Booking Data Processing ---
-    booking_files = [f for f in glob.glob(os.path.join(DATA_FOLDER, '*Booking.xlsx')) if not os.path.basename(f).startswith('~$')]
-    if booking_files:
-        # Using a more robust engine for booking files as well
-        df_b = pd.concat((pd.read_excel(f, engine='calamine', dtype={'Booking Number': str}) for f in booking_files), ignore_index=True)
-        print(f"Found and merged {len(booking_files)} booking files. Total rows: {len(df_b)}")
-        
-        df_b.rename(columns={
-            'Unit Name': 'unit_name', 'CHECKIN': 'checkin', 'CHECKOUT': 'checkout',
-            'Channel': 'channel', 'ON/OFFLINE': 'on_offline', 'Booking Number': 'booking_number',
-            'Pax': 'pax', 'Duration': 'duration', 'Price': 'price',
-            'CLEANING FEE': 'cleaning_fee', 'Platform Charge': 'platform_charge', 'TOTAL': 'total'
-        }, inplace=True)
-        
-        numeric_cols = ['pax', 'duration', 'price', 'cleaning_fee', 'platform_charge', 'total']
-        for col in numeric_cols:
-            if col not in df_b.columns:
-                df_b[col] = 0
-            df_b[col] = pd.to_numeric(df_b[col], errors='coerce').fillna(0)
-
-        df_b['pax'] = df_b['pax'].astype(int)
-        df_b['duration'] = df_b['duration'].astype(int)
-
-        df_b['checkin'] = pd.to_datetime(df_b['checkin'], errors='coerce')
-        df_b['checkout'] = pd.to_datetime(df_b['checkout'], errors='coerce')
-        df_b.dropna(subset=['checkin', 'checkout'], inplace=True)
-
-        model_columns = [c.name for c in Booking.__table__.columns]
-        final_df_b = df_b[df_b.columns.intersection(model_columns)]
-        
-        bookings_to_add = [Booking(**row) for _, row in final_df_b.iterrows() if 'id' not in row]
-        db.session.bulk_save_objects(bookings_to_add)
-        db.session.commit()
-        print(f"SUCCESS: Imported {len(bookings_to_add)} booking records.")
-
-    # --- Expense Data Processing ---
-    expense_files = [f for f in glob.glob(os.path.join(DATA_FOLDER, '*expenses*.xlsx')) if not os.path.basename(f).startswith('~$')]
-    if expense_files:
-        # Using 'calamine' engine, which is more robust for various .xlsx formats
-        df_e = pd.concat((pd.read_excel(f, engine='calamine') for f in expense_files), ignore_index=True)
-        print(f"Found and merged {len(expense_files)} expense files. Total rows: {len(df_e)}")
-        
-        column_map = {'Expenses Date': 'Date', 'PARTICULARS': 'Particulars', 'DEBIT': 'Amount'}
-        for old_col, new_col in column_map.items():
-            if old_col in df_e.columns:
-                if new_col not in df_e.columns:
-                    df_e[new_col] = df_e[old_col]
-                else:
-                    df_e[new_col] = df_e[new_col].fillna(df_e[old_col])
-        
-        df_e.rename(columns={'Unit Name': 'unit_name', 'Particulars': 'particulars', 'Amount': 'debit'}, inplace=True)
-        
-        df_e['date'] = pd.to_datetime(df_e['Date'], errors='coerce')
-        df_e['debit'] = pd.to_numeric(df_e['debit'], errors='coerce').fillna(0)
-        df_e.dropna(subset=['date', 'debit'], inplace=True)
-
-        expense_model_columns = [c.name for c in Expense.__table__.columns]
-        final_df_e = df_e[df_e.columns.intersection(expense_model_columns)]
-
-        expenses_to_add = [Expense(**row) for _, row in final_df_e.iterrows() if 'id' not in row]
-        db.session.bulk_save_objects(expenses_to_add)
-        db.session.commit()
-        print(f"SUCCESS: Imported {len(expenses_to_add)} expense records.")
-    else:
-        print("No expense files found to import.")
+    pruned = prune_workbook_cache(cache_dir)
+    if pruned:
+        print(f"INFO: Removed {pruned} cached workbooks that are no longer in use.")
 
     # --- Add Default User ---
     print("\nStep 3: Checking for default user...")
@@ -113,5 +116,241 @@ def import_data_command():
 
     print("\n--- Data Import Command Finished ---")
 
+@app.cli.command("rebuild-rollups")
+@with_appcontext
+def rebuild_rollups_command():
+    """Recomputes the monthly rollup tables from the booking and expense data."""
+    try:
+        unit_count, channel_count = rebuild_rollups()
+        bump_data_version(all_periods=True)
+        db.session.commit()
+        print(f"SUCCESS: Rebuilt {unit_count} monthly unit rollups and {channel_count} channel rollups.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"An error occurred while rebuilding rollups: {e}")
+
+@app.cli.command("check-rollups")
+@with_appcontext
+def check_rollups_command():
+    """Compares the monthly rollup tables with the raw booking and expense data."""
+    problems = check_rollups()
+    for problem in problems:
+        print(problem)
+    if problems:
+        print(f"\nFound {len(problems)} rollup inconsistencies. Run 'flask rebuild-rollups' to repair them.")
+        raise SystemExit(1)
+    print("Rollups are consistent with the raw data.")
+
+@app.cli.command("month-end-statements")
+@click.option('--year', type=int, required=True)
+@click.option('--month', type=int, required=True)
+@with_appcontext
+def month_end_statements_command(year, month):
+    """Renders every owner's monthly statement as one batch and waits for it to finish."""
+    owners = [u.id for u in User.query.filter_by(role='owner').order_by(User.id)]
+    batch_id = str(uuid.uuid4())
+    statement_queue.enqueue(owners, year, month, batch_id=batch_id)
+    print(f"Queued {len(owners)} statements for {year}-{month:02d} (batch {batch_id}).")
+    statement_queue.executor.shutdown(wait=True)
+    db.session.expire_all()
+    for job in StatementJob.query.filter_by(batch_id=batch_id).order_by(StatementJob.user_id):
+        print(f"  {job.user_id}: {job.status} {job.file_path or job.error or ''}")
+
+@app.cli.command("benchmark-statements")
+@click.option('--year', type=int, required=True)
+@click.option('--month', type=int, required=True)
+@click.option('--user', 'user_id', default='admin', help='Render the statement as this user.')
+@click.option('--repeat', type=int, default=5)
+@click.option('--renderer', 'renderers', multiple=True, help='Renderer to measure (default: all).')
+@with_appcontext
+def benchmark_statements_command(year, month, user_id, repeat, renderers):
+    """Compares statement render latency and peak memory across the PDF renderers."""
+    import resource
+    import statistics
+    import time
+    from flask_login import login_user
+    from mspro_app.renderers import RENDERERS
+    from mspro_app.statements import statement_pdf
+
+    print(f"{'renderer':<10} {'mean ms':>9} {'max ms':>9} {'size KB':>8} {'RSS +MB':>8} {'child RSS MB':>13}")
+    for name in renderers or RENDERERS:
+        with app.test_request_context():
+            login_user(db.session.get(User, user_id))
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            child_before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            timings = []
+            try:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    pdf = statement_pdf(year, month, renderer=name)
+                    timings.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                print(f"{name:<10} failed: {e}")
+                continue
+            rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+            # ru_maxrss of children is a high-water mark, so it is only this renderer's if it rose.
+            child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            child_rss = f"{child_rss / 1024:.1f}" if child_rss > child_before else '-'
+            print(f"{name:<10} {statistics.mean(timings):>9.1f} {max(timings):>9.1f} {len(pdf) / 1024:>8.1f} "
+                  f"{rss_growth:>8.1f} {child_rss:>13}")
+
+@app.cli.command("benchmark-summaries")
+@click.option('--user', 'user_id', default='admin', help='Build the summaries as this user.')
+@click.option('--years', 'year_counts', type=int, multiple=True, help='Numbers of years to summarise (default: 1, 5, 10, 25).')
+@click.option('--room-type', default='All')
+@with_appcontext
+def benchmark_summaries_command(user_id, year_counts, room_type):
+    """Counts the SQL statements and time of the annual/quarterly summaries per number of years; fails if the count grows."""
+    import time
+    from datetime import datetime
+    from flask_login import login_user
+    from sqlalchemy import event
+    from mspro_app.aggregation import period_summaries
+
+    statements = []
+    def count_statement(*args):
+        statements.append(args[2])
+
+    print(f"{'years':>6} {'annual queries':>15} {'ms':>7} {'quarterly queries':>18} {'ms':>7}")
+    counts = set()
+    with app.test_request_context():
+        login_user(db.session.get(User, user_id))
+        last_year = datetime.now().year
+        period_summaries([last_year], room_type)  # warm-up: the user's lazily loaded units
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            for year_count in year_counts or (1, 5, 10, 25):
+                years = range(last_year - year_count + 1, last_year + 1)
+                row = f"{year_count:>6}"
+                for by_quarter, width in ((False, 15), (True, 18)):
+                    statements.clear()
+                    started = time.perf_counter()
+                    period_summaries(years, room_type, by_quarter=by_quarter)
+                    row += f" {len(statements):>{width}} {(time.perf_counter() - started) * 1000:>7.1f}"
+                    counts.add(len(statements))
+                print(row)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+    if len(counts) > 1:
+        print("FAIL: the number of queries depends on the number of years.")
+        raise SystemExit(1)
+    print(f"OK: {counts.pop()} queries whatever the number of years.")
+
+@app.cli.command("explain-queries")
+@click.option('--rows', type=int, default=300000, help='Synthetic bookings to seed (plus a tenth as many expenses).')
+@click.option('--user', 'user_id', default='admin', help='Build the queries as this user.')
+@with_appcontext
+def explain_queries_command(rows, user_id):
+    """Seeds synthetic bookings/expenses, EXPLAINs the period-filtered queries and fails on a full table scan. Rolls everything back."""
+    import random
+    import re
+    import time
+    from datetime import date, timedelta
+    from flask_login import login_user
+    from sqlalchemy import insert, select, text
+    from mspro_app.filters import build_filtered_queries, detailed_records_query, booking_overlap, unit_scope, period_bounds
+    from mspro_app.dimensions import dimension_ids
+    from mspro_app.models import Unit
+
+    postgresql = db.session.get_bind().dialect.name == 'postgresql'
+    rnd = random.Random(0)
+    units = [f'EXPLAIN-{i:03d}' for i in range(40)]
+    first_day, days = date(2000, 1, 1), 3650  # ten years, so one month is about 1% of the rows
+    year, month = 2005, 6
+
+    def seed_rows(count, make):
+        for start in range(0, count, 10000):
+            yield [make(i) for i in range(start, min(start + 10000, count))]
+
+    def booking(i):
+        checkin = first_day + timedelta(days=rnd.randrange(days))
+        nights = rnd.randrange(1, 8)
+        unit = rnd.choice(units)
+        return dict(id=f'explain-b{i}', unit_name=unit, unit_id=unit_ids[unit], checkin=checkin, checkout=checkin + timedelta(days=nights),
+                    channel='Airbnb', booking_number=f'X{i}', pax=2, duration=nights, total=100.0 * nights)
+
+    def expense(i):
+        unit = rnd.choice(units)
+        return dict(id=f'explain-e{i}', unit_name=unit, unit_id=unit_ids[unit], date=first_day + timedelta(days=rnd.randrange(days)), debit=10.0)
+
+    def plan(statement):
+        sql = str(statement.compile(db.session.get_bind(), compile_kwargs={'literal_binds': True}))
+        explain = 'EXPLAIN ' if postgresql else 'EXPLAIN QUERY PLAN '
+        return [str(r[-1]) for r in db.session.execute(text(explain + sql))]
+
+    full_scan = re.compile(r'Seq Scan on (booking|expense)\b' if postgresql else r'^SCAN (booking|expense)\b')
+    failures = 0
+    try:
+        started = time.perf_counter()
+        unit_ids = dimension_ids(db.session.connection(), Unit, units)
+        for batch in seed_rows(rows, booking):
+            db.session.execute(insert(Booking), batch)
+        for batch in seed_rows(rows // 10, expense):
+            db.session.execute(insert(Expense), batch)
+        db.session.execute(text('ANALYZE booking' if postgresql else 'ANALYZE'))
+        if postgresql:
+            db.session.execute(text('ANALYZE expense'))
+        print(f"Seeded {rows} bookings and {rows // 10} expenses in {time.perf_counter() - started:.1f} s.")
+
+        with app.test_request_context():
+            login_user(db.session.get(User, user_id))
+            bookings, expenses = build_filtered_queries(year, month)
+            room_bookings, room_expenses = build_filtered_queries(year, month, units[0])
+            queries = {
+                'statement bookings': bookings.statement, 'statement expenses': expenses.statement,
+                'room bookings': room_bookings.statement, 'room expenses': room_expenses.statement,
+                'detailed records': detailed_records_query(year, month),
+                'calendar events': select(Booking.id, Booking.checkin, Booking.checkout).where(
+                    booking_overlap(*period_bounds(year, month)), unit_scope(Booking)),
+            }
+            for name, statement in queries.items():
+                lines = plan(statement)
+                scans = [line for line in lines if full_scan.search(line.strip().lstrip('->').strip())]
+                failures += bool(scans)
+                print(f"{'FAIL' if scans else 'OK':<5}{name}")
+                for line in lines:
+                    print(f"       {line}")
+    finally:
+        db.session.rollback()
+    if failures:
+        print(f"FAIL: {failures} queries scan a whole booking/expense table.")
+        raise SystemExit(1)
+    print("OK: every period query reads booking and expense through an index.")
+
+# Loaded on demand by the import CLI, exports and statements; a web worker must not import them at startup.
+LAZY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl', 'pdfkit', 'reportlab')
+
+@app.cli.command("benchmark-startup")
+@click.option('--repeat', type=int, default=5)
+@click.option('--top', type=int, default=8, help='Number of slowest imports to list.')
+def benchmark_startup_command(repeat, top):
+    """Measures a worker's cold start (python -X importtime of wsgi, plus RSS) and fails if a lazy module loads."""
+    import re
+    import statistics
+    import subprocess
+    import sys
+
+    probe = ("import resource, sys, wsgi; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss); "
+             f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    timings, rss = [], []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        imports = [re.match(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)', line) for line in result.stderr.splitlines()]
+        imports = [(m.group(4), int(m.group(2)), len(m.group(3)) // 2) for m in imports if m]
+        timings.append(next(cumulative for name, cumulative, _ in imports if name == 'wsgi') / 1000)
+        max_rss, loaded = result.stdout.splitlines()[-2:]
+        rss.append(int(max_rss) / 1024)
+
+    print(f"wsgi import: mean {statistics.mean(timings):.0f} ms, min {min(timings):.0f} ms over {repeat} runs; "
+          f"worker RSS after import: {statistics.mean(rss):.1f} MB")
+    print("Slowest imports (cumulative ms):")
+    for name, cumulative, _ in sorted((i for i in imports if 1 <= i[2] <= 3), key=lambda i: -i[1])[:top]:
+        print(f"  {cumulative / 1000:>8.1f}  {name}")
+    if loaded:
+        print(f"FAIL: imported at startup: {loaded}")
+        raise SystemExit(1)
+    print(f"OK: none of {', '.join(LAZY_MODULES)} imported at startup.")
+
 if __name__ == "__main__":
     app.run()
\ No newline at end of file